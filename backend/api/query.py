@@ -3,13 +3,16 @@
 """
 
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
+import json
 import logging
 from typing import List
 
 from backend.models.schemas import QueryRequest, QueryResponse, ChatHistory, ChatMessage
 from backend.services.qa_service import QAService
 from backend.services.session_service import SessionService
+from backend.services.speech_service import SpeechService
 from backend.core.database import get_db
 
 router = APIRouter()
@@ -18,6 +21,7 @@ logger = logging.getLogger(__name__)
 # 初始化服务
 qa_service = QAService()
 session_service = SessionService()
+speech_service = SpeechService()
 
 @router.post("/query", response_model=QueryResponse)
 async def intelligent_qa(
@@ -83,6 +87,59 @@ async def intelligent_qa(
             detail=f"问答服务异常: {str(e)}"
         )
 
+@router.post("/query/stream")
+async def intelligent_qa_stream(
+    request: QueryRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    流式智能问答接口
+    以SSE逐句返回回答，最后一条事件携带置信度和参考来源
+    """
+    if not request.question.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="问题不能为空"
+        )
+    
+    async def generate_events():
+        async for event in qa_service.stream_answer(
+            question=request.question,
+            session_id=request.session_id,
+            db=db
+        ):
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        generate_events(),
+        media_type="text/event-stream"
+    )
+
+@router.post("/query/speech")
+async def intelligent_qa_speech(
+    request: QueryRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    语音问答接口
+    回答逐句合成语音并流式返回，首句生成后即开始播放
+    """
+    if not request.question.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="问题不能为空"
+        )
+    
+    return StreamingResponse(
+        qa_service.stream_answer_audio(
+            question=request.question,
+            session_id=request.session_id,
+            db=db,
+            speech_service=speech_service
+        ),
+        media_type="audio/wav"
+    )
+
 @router.get("/history/{session_id}", response_model=ChatHistory)
 async def get_chat_history(
     session_id: str,
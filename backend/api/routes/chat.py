@@ -2,14 +2,19 @@
 智能问答API路由
 """
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Optional, Tuple
+import json
 import uuid
 from datetime import datetime
 
 from backend.services.llm_service import llm_service
+from backend.api.query import qa_service
 from backend.models.knowledge import ChatSession, ChatMessage
-from backend.core.database import get_db, SessionLocal
+from backend.core.database import get_db
 
 router = APIRouter()
 
@@ -25,56 +30,108 @@ class ChatResponse(BaseModel):
     sources: List[Dict]
     response_time: float
 
+async def _get_session(request: ChatRequest, db: AsyncSession) -> ChatSession:
+    """获取或创建会话"""
+    session_id = request.session_id or str(uuid.uuid4())
+    session = (await db.execute(
+        select(ChatSession).where(ChatSession.session_id == session_id)
+    )).scalars().first()
+    
+    if not session:
+        session = ChatSession(
+            session_id=session_id,
+            user_id=request.user_id or "anonymous"
+        )
+        db.add(session)
+        await db.commit()
+    
+    return session
+
+async def _prepare_chat(request: ChatRequest, db: AsyncSession) -> Tuple[ChatSession, List[Dict], str, List[Dict]]:
+    """获取会话、历史对话并检索知识库构建上下文"""
+    session = await _get_session(request, db)
+    session_id = session.session_id
+    
+    # 获取历史对话
+    history = []
+    recent_messages = (await db.execute(
+        select(ChatMessage)
+        .where(ChatMessage.session_id == session_id)
+        .order_by(ChatMessage.created_at.desc())
+        .limit(10)
+    )).scalars().all()
+    
+    for msg in reversed(recent_messages):
+        role = "user" if msg.message_type == "user" else "assistant"
+        history.append({"role": role, "content": msg.content})
+    
+    # 搜索知识库
+    knowledge_results = await llm_service.search_knowledge(request.question)
+    
+    # 构建上下文
+    context = ""
+    sources = []
+    for result in knowledge_results:
+        if result["type"] == "trusted_qa":
+            context += f"问题：{result['question']}\n答案：{result['answer']}\n\n"
+        elif result["type"] == "faq":
+            context += f"FAQ：{result['question']}\n答案：{result['answer']}\n\n"
+        elif result["type"] == "document":
+            context += f"文档内容：{result['content']}\n\n"
+        
+        sources.append({
+            "type": result["type"],
+            "content": result.get("question", result.get("content", "")),
+            "confidence": result["confidence"],
+            "source": result["source"]
+        })
+    
+    return session, history, context, sources
+
+async def _save_chat(
+    db: AsyncSession,
+    session: ChatSession,
+    question: str,
+    answer: str,
+    confidence: float,
+    sources: List[Dict],
+    response_time: float
+):
+    """保存对话记录并更新会话统计"""
+    user_message = ChatMessage(
+        session_id=session.session_id,
+        message_type="user",
+        content=question,
+        response_time=response_time
+    )
+    
+    assistant_message = ChatMessage(
+        session_id=session.session_id,
+        message_type="assistant",
+        content=answer,
+        confidence_score=confidence,
+        source_info=sources
+    )
+    
+    db.add(user_message)
+    db.add(assistant_message)
+    
+    # 更新会话统计
+    session.total_messages += 2
+    await db.commit()
+
+def _sse(data: Dict) -> str:
+    """编码为SSE事件"""
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @router.post("/query", response_model=ChatResponse)
-async def chat_query(request: ChatRequest, db: SessionLocal = Depends(get_db)):
+async def chat_query(request: ChatRequest, db: AsyncSession = Depends(get_db)):
     """智能问答"""
     try:
         start_time = datetime.now()
         
-        # 获取或创建会话
-        session_id = request.session_id or str(uuid.uuid4())
-        session = db.query(ChatSession).filter(
-            ChatSession.session_id == session_id
-        ).first()
-        
-        if not session:
-            session = ChatSession(
-                session_id=session_id,
-                user_id=request.user_id or "anonymous"
-            )
-            db.add(session)
-            db.commit()
-        
-        # 获取历史对话
-        history = []
-        recent_messages = db.query(ChatMessage).filter(
-            ChatMessage.session_id == session_id
-        ).order_by(ChatMessage.created_at.desc()).limit(10).all()
-        
-        for msg in reversed(recent_messages):
-            role = "user" if msg.message_type == "user" else "assistant"
-            history.append({"role": role, "content": msg.content})
-        
-        # 搜索知识库
-        knowledge_results = await llm_service.search_knowledge(request.question)
-        
-        # 构建上下文
-        context = ""
-        sources = []
-        for result in knowledge_results:
-            if result["type"] == "trusted_qa":
-                context += f"问题：{result['question']}\n答案：{result['answer']}\n\n"
-            elif result["type"] == "faq":
-                context += f"FAQ：{result['question']}\n答案：{result['answer']}\n\n"
-            elif result["type"] == "document":
-                context += f"文档内容：{result['content']}\n\n"
-            
-            sources.append({
-                "type": result["type"],
-                "content": result.get("question", result.get("content", "")),
-                "confidence": result["confidence"],
-                "source": result["source"]
-            })
+        session, history, context, sources = await _prepare_chat(request, db)
+        session_id = session.session_id
         
         # 生成回答
         answer, confidence = await llm_service.generate_response(
@@ -85,28 +142,10 @@ async def chat_query(request: ChatRequest, db: SessionLocal = Depends(get_db)):
         response_time = (datetime.now() - start_time).total_seconds()
         
         # 保存对话记录
-        user_message = ChatMessage(
-            session_id=session_id,
-            message_type="user",
-            content=request.question,
-            response_time=response_time
-        )
-        
-        assistant_message = ChatMessage(
-            session_id=session_id,
-            message_type="assistant",
-            content=answer,
-            confidence_score=confidence,
-            source_info=str(sources)
+        await _save_chat(
+            db, session, request.question, answer, confidence, sources, response_time
         )
         
-        db.add(user_message)
-        db.add(assistant_message)
-        
-        # 更新会话统计
-        session.total_messages += 2
-        db.commit()
-        
         return ChatResponse(
             answer=answer,
             session_id=session_id,
@@ -118,12 +157,42 @@ async def chat_query(request: ChatRequest, db: SessionLocal = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"问答处理失败: {str(e)}")
 
+@router.post("/query/stream")
+async def chat_query_stream(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+    """智能问答（流式，SSE逐句返回，事件格式与 /api/query/stream 一致）"""
+    start_time = datetime.now()
+    
+    try:
+        session = await _get_session(request, db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"问答处理失败: {str(e)}")
+    
+    async def event_stream():
+        try:
+            async for event in qa_service.stream_answer(request.question, session.session_id, db):
+                if event["type"] == "done":
+                    response_time = (datetime.now() - start_time).total_seconds()
+                    event = {**event, "response_time": response_time}
+                    yield _sse(event)
+                    await _save_chat(
+                        db, session, request.question, event["answer"],
+                        event["confidence"], event["sources"], response_time
+                    )
+                else:
+                    yield _sse(event)
+        except Exception as e:
+            yield _sse({"type": "error", "text": f"问答处理失败: {str(e)}"})
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @router.get("/sessions/{session_id}/history")
-async def get_chat_history(session_id: str, db: SessionLocal = Depends(get_db)):
+async def get_chat_history(session_id: str, db: AsyncSession = Depends(get_db)):
     """获取对话历史"""
-    messages = db.query(ChatMessage).filter(
-        ChatMessage.session_id == session_id
-    ).order_by(ChatMessage.created_at).all()
+    messages = (await db.execute(
+        select(ChatMessage)
+        .where(ChatMessage.session_id == session_id)
+        .order_by(ChatMessage.created_at)
+    )).scalars().all()
     
     history = []
     for msg in messages:
@@ -137,18 +206,18 @@ async def get_chat_history(session_id: str, db: SessionLocal = Depends(get_db)):
     return {"session_id": session_id, "history": history}
 
 @router.delete("/sessions/{session_id}")
-async def clear_session(session_id: str, db: SessionLocal = Depends(get_db)):
+async def clear_session(session_id: str, db: AsyncSession = Depends(get_db)):
     """清除会话"""
     # 删除消息
-    db.query(ChatMessage).filter(
-        ChatMessage.session_id == session_id
-    ).delete()
+    await db.execute(
+        delete(ChatMessage).where(ChatMessage.session_id == session_id)
+    )
     
     # 删除会话
-    db.query(ChatSession).filter(
-        ChatSession.session_id == session_id
-    ).delete()
+    await db.execute(
+        delete(ChatSession).where(ChatSession.session_id == session_id)
+    )
     
-    db.commit()
+    await db.commit()
     
     return {"message": "会话已清除"}
\ No newline at end of file
@@ -17,6 +17,7 @@ class Settings(BaseSettings):
     # 服务器配置
     HOST: str = "0.0.0.0"
     PORT: int = 8000
+    EVENT_LOOP: str = "auto"  # auto / rloop（Linux，mio/epoll实现的实验性事件循环，不使用io_uring）
     
     # 数据库配置 - PostgreSQL
     POSTGRES_HOST: str = "localhost"
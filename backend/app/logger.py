@@ -49,5 +49,3 @@ def get_logger(name: str = None):
         return logging.getLogger(f"socialwise.{name}")
     return logging.getLogger("socialwise")
 
-# 初始化日志
-setup_logger()
\ No newline at end of file
@@ -4,6 +4,7 @@ SocialWise 主应用入口
 
 import asyncio
 import logging
+import sys
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends
 from fastapi.staticfiles import StaticFiles
@@ -13,15 +14,13 @@ import uvicorn
 
 from .config import settings
 from .database import db_manager
-from .logger import setup_logging
+from .utils.logger import setup_logger
 from .metrics import MetricsMiddleware, get_metrics, get_metrics_content_type
 from .services.session_service import SessionService
 from .services.speech_service import SpeechService
 from .services.nlp_service import NLPService
 from .services.knowledge_service import KnowledgeService
 
-# 设置日志
-setup_logging()
 logger = logging.getLogger(__name__)
 
 # 全局服务实例
@@ -36,6 +35,8 @@ async def lifespan(app: FastAPI):
     global session_service, speech_service, nlp_service, knowledge_service
     
     try:
+        # 在worker进程内初始化日志，避免fork前打开日志文件
+        setup_logger()
         logger.info("SocialWise 应用启动中...")
         
         # 初始化数据库
@@ -320,11 +321,24 @@ async def metrics():
         media_type=get_metrics_content_type()
     )
 
+def _select_event_loop() -> str:
+    """选择事件循环实现"""
+    # Linux下可选用rloop（Rust实现、基于mio/epoll的事件循环，并非io_uring），实验性替代默认事件循环
+    if settings.EVENT_LOOP == "rloop" and sys.platform == "linux":
+        try:
+            import rloop
+            asyncio.set_event_loop_policy(rloop.EventLoopPolicy())
+            return "none"
+        except ImportError:
+            logger.warning("未安装rloop，回退到默认事件循环")
+    return "auto"
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
         host=settings.HOST,
         port=settings.PORT,
         reload=settings.DEBUG,
-        log_level=settings.LOG_LEVEL.lower()
+        log_level=settings.LOG_LEVEL.lower(),
+        loop=_select_event_loop()
     )
\ No newline at end of file
@@ -143,7 +143,8 @@ class NLPService:
 请只返回类别名称，不要其他内容。
 """
             
-            response = Generation.call(
+            response = await asyncio.to_thread(
+                Generation.call,
                 model="qwen-turbo",
                 prompt=prompt,
                 max_tokens=50
@@ -264,7 +265,8 @@ class NLPService:
 """
             
             # 调用通义千问生成回答
-            response = Generation.call(
+            response = await asyncio.to_thread(
+                Generation.call,
                 model="qwen-max",
                 prompt=prompt,
                 max_tokens=512,
@@ -354,7 +356,8 @@ class NLPService:
 生成的问答对：
 """
                 
-                response = Generation.call(
+                response = await asyncio.to_thread(
+                    Generation.call,
                     model="qwen-max",
                     prompt=prompt,
                     max_tokens=1024,
@@ -419,7 +422,8 @@ class NLPService:
 {{"accuracy": 分数, "completeness": 分数, "relevance": 分数, "clarity": 分数, "usefulness": 分数, "overall": 总分, "feedback": "具体反馈"}}
 """
             
-            response = Generation.call(
+            response = await asyncio.to_thread(
+                Generation.call,
                 model="qwen-turbo",
                 prompt=prompt,
                 max_tokens=256
@@ -5,13 +5,14 @@
 import asyncio
 import logging
 import base64
-import hashlib
 import hmac
-import json
+import ssl
 import time
 import urllib.parse
+import numpy as np
+import orjson
 import websockets
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 import aiohttp
 import wave
 import io
@@ -20,6 +21,18 @@ from ..utils.config import settings
 
 logger = logging.getLogger(__name__)
 
+def _json_fields(obj: Dict[str, Any]) -> bytes:
+    """序列化字典并去掉外层花括号，用于拼接JSON帧"""
+    return orjson.dumps(obj)[1:-1]
+
+def _pcm_stats(buf: bytes) -> Tuple[float, float]:
+    """计算16位PCM音频的峰值和均方根（向量化实现）"""
+    samples = np.frombuffer(buf, dtype=np.int16, count=len(buf) // 2)
+    if samples.size == 0:
+        return 0.0, 0.0
+    wide = samples.astype(np.int32)
+    return float(np.abs(wide).max()), float(np.sqrt(np.mean(wide * wide)))
+
 class SpeechService:
     """语音服务类"""
     
@@ -28,6 +41,8 @@ class SpeechService:
         self.app_id = settings.IFLYTEK_APP_ID
         self.api_secret = settings.IFLYTEK_API_SECRET
         self.api_key = settings.IFLYTEK_API_KEY
+        self._api_secret_bytes = (self.api_secret or "").encode('utf-8')
+        self._config_ok = bool(self.app_id and self.api_secret and self.api_key)
         
         # ASR配置
         self.asr_url = "wss://iat-api.xfyun.cn/v2/iat"
@@ -39,13 +54,35 @@ class SpeechService:
         self.sample_rate = settings.AUDIO_SAMPLE_RATE
         self.audio_format = settings.AUDIO_FORMAT
         
+        # WebSocket连接配置（讯飞每次会话需重新签名URL，无法复用连接，
+        # 这里复用SSL上下文并限制并发会话数，避免突发流量下集中重连）
+        self._ssl_ctx = ssl.create_default_context()
+        self._ws_semaphore = asyncio.Semaphore(settings.IFLYTEK_MAX_CONCURRENCY)
+        
+        # 预先序列化请求帧中不随调用变化的common/business部分
+        common = b'{"common":' + orjson.dumps({"app_id": self.app_id})
+        self._asr_frame_prefix = common + b',"business":{' + _json_fields({
+            "language": "zh_cn",
+            "domain": "iat",
+            "accent": "mandarin",
+            "vinfo": 1,
+            "vad_eos": 10000
+        })
+        self._tts_frame_prefix = common + b',"business":{' + _json_fields({
+            "aue": "raw",
+            "auf": "audio/L16;rate=16000",
+            "pitch": 50,
+            "bgs": 0,
+            "tte": "UTF8"
+        })
+        
         logger.info("语音服务初始化完成")
     
     async def initialize(self):
         """初始化语音服务"""
         try:
             # 验证配置
-            if not all([self.app_id, self.api_secret, self.api_key]):
+            if not self._config_ok:
                 logger.warning("讯飞语音配置不完整，语音功能可能无法正常使用")
             
             logger.info("语音服务初始化成功")
@@ -69,31 +106,43 @@ class SpeechService:
             # 生成签名字符串
             signature_origin = f"host: {host}\ndate: {date}\nGET {path} HTTP/1.1"
             
-            # 计算签名
-            signature_sha = hmac.new(
-                self.api_secret.encode('utf-8'),
+            # 计算签名（讯飞协议固定为hmac-sha256，使用一次性摘要接口）
+            signature_sha = hmac.digest(
+                self._api_secret_bytes,
                 signature_origin.encode('utf-8'),
-                digestmod=hashlib.sha256
-            ).digest()
+                'sha256'
+            )
             signature_sha_base64 = base64.b64encode(signature_sha).decode(encoding='utf-8')
             
             # 生成authorization
             authorization_origin = f'api_key="{self.api_key}", algorithm="hmac-sha256", headers="host date request-line", signature="{signature_sha_base64}"'
             authorization = base64.b64encode(authorization_origin.encode('utf-8')).decode(encoding='utf-8')
             
-            # 生成完整URL
-            params = {
-                'authorization': authorization,
-                'date': date,
-                'host': host
-            }
-            
-            return f"{url}?" + urllib.parse.urlencode(params)
+            # 生成完整URL（host为域名无需转义）
+            return (
+                f"{url}?authorization={urllib.parse.quote(authorization, safe='')}"
+                f"&date={urllib.parse.quote(date, safe='')}&host={host}"
+            )
             
         except Exception as e:
             logger.error(f"生成认证URL失败: {str(e)}")
             raise
     
+    def _connect(self, auth_url: str):
+        """建立讯飞WebSocket连接"""
+        # 音频负载为base64/PCM，关闭permessage-deflate以节省逐帧压缩开销；
+        # 单次会话很短，无需心跳保活；放宽收发缓冲，TTS的大量小帧可连续到达而不触发背压
+        return websockets.connect(
+            auth_url,
+            ssl=self._ssl_ctx,
+            open_timeout=10,
+            compression=None,
+            max_size=2 ** 24,
+            max_queue=256,
+            write_limit=2 ** 20,
+            ping_interval=None
+        )
+    
     async def recognize_speech(self, audio_data: str, audio_format: str = "wav", sample_rate: int = 16000) -> Dict[str, Any]:
         """语音识别"""
         try:
@@ -103,39 +152,32 @@ class SpeechService:
             # 生成认证URL
             auth_url = self._generate_auth_url(self.asr_url)
             
-            # 准备识别参数
-            params = {
-                "common": {
-                    "app_id": self.app_id
-                },
-                "business": {
-                    "language": "zh_cn",
-                    "domain": "iat",
-                    "accent": "mandarin",
-                    "vinfo": 1,
-                    "vad_eos": 10000,
-                    "sample_rate": sample_rate,
-                    "audio_format": audio_format
-                },
-                "data": {
+            # 准备识别参数（在预序列化的common/business前缀后拼接可变字段）
+            frame = b"".join((
+                self._asr_frame_prefix,
+                b",",
+                _json_fields({"sample_rate": sample_rate, "audio_format": audio_format}),
+                b'},"data":',
+                orjson.dumps({
                     "status": 2,  # 一次性传输
                     "format": audio_format,
                     "encoding": "raw",
                     "audio": audio_data
-                }
-            }
+                }),
+                b"}"
+            ))
             
             # 建立WebSocket连接并发送数据
             result_text = ""
             confidence = 0.0
             
-            async with websockets.connect(auth_url) as websocket:
+            async with self._ws_semaphore, self._connect(auth_url) as websocket:
                 # 发送识别参数
-                await websocket.send(json.dumps(params))
+                await websocket.send(frame.decode())
                 
                 # 接收识别结果
                 async for message in websocket:
-                    response = json.loads(message)
+                    response = orjson.loads(message)
                     
                     if response.get("code") != 0:
                         error_msg = response.get("message", "语音识别失败")
@@ -174,37 +216,29 @@ class SpeechService:
             # 生成认证URL
             auth_url = self._generate_auth_url(self.tts_url)
             
-            # 准备合成参数
-            params = {
-                "common": {
-                    "app_id": self.app_id
-                },
-                "business": {
-                    "aue": "raw",
-                    "auf": "audio/L16;rate=16000",
-                    "vcn": voice,
-                    "speed": speed,
-                    "volume": volume,
-                    "pitch": 50,
-                    "bgs": 0,
-                    "tte": "UTF8"
-                },
-                "data": {
+            # 准备合成参数（在预序列化的common/business前缀后拼接可变字段）
+            frame = b"".join((
+                self._tts_frame_prefix,
+                b",",
+                _json_fields({"vcn": voice, "speed": speed, "volume": volume}),
+                b'},"data":',
+                orjson.dumps({
                     "status": 2,
                     "text": base64.b64encode(text.encode('utf-8')).decode('utf-8')
-                }
-            }
+                }),
+                b"}"
+            ))
             
             # 建立WebSocket连接并发送数据
-            audio_data = b""
+            audio_chunks = []
             
-            async with websockets.connect(auth_url) as websocket:
+            async with self._ws_semaphore, self._connect(auth_url) as websocket:
                 # 发送合成参数
-                await websocket.send(json.dumps(params))
+                await websocket.send(frame.decode())
                 
                 # 接收合成结果
                 async for message in websocket:
-                    response = json.loads(message)
+                    response = orjson.loads(message)
                     
                     if response.get("code") != 0:
                         error_msg = response.get("message", "语音合成失败")
@@ -216,14 +250,14 @@ class SpeechService:
                     if data:
                         audio_chunk = data.get("audio")
                         if audio_chunk:
-                            audio_data += base64.b64decode(audio_chunk)
+                            audio_chunks.append(base64.b64decode(audio_chunk))
                     
                     # 检查是否结束
                     if response.get("data", {}).get("status") == 2:
                         break
             
             # 转换为WAV格式
-            wav_data = self._convert_to_wav(audio_data)
+            wav_data = self._convert_to_wav(b"".join(audio_chunks))
             
             return {
                 "success": True,
@@ -280,7 +314,10 @@ class SpeechService:
                 if estimated_duration > max_duration:
                     return {"valid": False, "error": f"音频时长超过限制({max_duration}秒)"}
             
-            return {"valid": True}
+            # 音量统计，供调用方做静音/削波判断
+            peak, rms = _pcm_stats(audio_data)
+            
+            return {"valid": True, "peak": peak, "rms": rms}
             
         except Exception as e:
             logger.error(f"音频验证失败: {str(e)}")
@@ -289,15 +326,11 @@ class SpeechService:
     async def health_check(self) -> Dict[str, Any]:
         """健康检查"""
         try:
-            # 检查配置
-            config_ok = all([self.app_id, self.api_secret, self.api_key])
-            
-            # 可以添加更多检查，如网络连接测试
-            
+            # 配置完整性在初始化时已计算，可以添加更多检查，如网络连接测试
             return {
-                "config": config_ok,
-                "asr_available": config_ok,
-                "tts_available": config_ok
+                "config": self._config_ok,
+                "asr_available": self._config_ok,
+                "tts_available": self._config_ok
             }
             
         except Exception as e:
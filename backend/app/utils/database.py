@@ -12,6 +12,131 @@ from .config import settings
 
 logger = logging.getLogger(__name__)
 
+# 表结构DDL（合并为单条多语句，建表只需一次往返）
+_SCHEMA_DDL = """
+-- 文档表
+CREATE TABLE IF NOT EXISTS documents (
+    id VARCHAR(100) PRIMARY KEY,
+    filename VARCHAR(255) NOT NULL,
+    file_path TEXT NOT NULL,
+    document_type VARCHAR(50) DEFAULT 'raw',
+    content TEXT,
+    metadata JSONB DEFAULT '{}',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- FAQ表
+CREATE TABLE IF NOT EXISTS faq (
+    id SERIAL PRIMARY KEY,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    category VARCHAR(100),
+    tags JSONB DEFAULT '[]',
+    is_active BOOLEAN DEFAULT true,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 可信问答表
+CREATE TABLE IF NOT EXISTS trusted_qa (
+    id SERIAL PRIMARY KEY,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    source VARCHAR(255),
+    confidence_score FLOAT DEFAULT 0.0,
+    tags JSONB DEFAULT '[]',
+    is_verified BOOLEAN DEFAULT false,
+    verifier VARCHAR(100),
+    verified_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 生成问答表
+CREATE TABLE IF NOT EXISTS generated_qa (
+    id SERIAL PRIMARY KEY,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    source VARCHAR(255),
+    confidence_score FLOAT DEFAULT 0.0,
+    metadata JSONB DEFAULT '{}',
+    is_verified BOOLEAN,
+    verifier VARCHAR(100),
+    verification_notes TEXT,
+    verified_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 聊天会话表
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    id VARCHAR(100) PRIMARY KEY,
+    user_id VARCHAR(100),
+    session_data JSONB DEFAULT '{}',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP
+);
+
+-- 聊天消息表
+CREATE TABLE IF NOT EXISTS chat_messages (
+    id SERIAL PRIMARY KEY,
+    session_id VARCHAR(100) NOT NULL,
+    role VARCHAR(20) NOT NULL,
+    content TEXT NOT NULL,
+    metadata JSONB DEFAULT '{}',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE
+);
+
+-- 用户反馈表
+CREATE TABLE IF NOT EXISTS user_feedback (
+    id SERIAL PRIMARY KEY,
+    session_id VARCHAR(100),
+    message_id INTEGER,
+    rating INTEGER CHECK (rating >= 1 AND rating <= 5),
+    comment TEXT,
+    metadata JSONB DEFAULT '{}',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (session_id) REFERENCES chat_sessions(id) ON DELETE SET NULL,
+    FOREIGN KEY (message_id) REFERENCES chat_messages(id) ON DELETE SET NULL
+);
+"""
+
+# 索引DDL
+_INDEX_DDL = """
+-- 文档表索引
+CREATE INDEX IF NOT EXISTS idx_documents_type ON documents(document_type);
+CREATE INDEX IF NOT EXISTS idx_documents_created ON documents(created_at);
+
+-- FAQ表索引
+CREATE INDEX IF NOT EXISTS idx_faq_category ON faq(category);
+CREATE INDEX IF NOT EXISTS idx_faq_active ON faq(is_active);
+CREATE INDEX IF NOT EXISTS idx_faq_question_text ON faq USING gin(to_tsvector('chinese', question));
+
+-- 可信问答表索引
+CREATE INDEX IF NOT EXISTS idx_trusted_qa_verified ON trusted_qa(is_verified);
+CREATE INDEX IF NOT EXISTS idx_trusted_qa_confidence ON trusted_qa(confidence_score);
+CREATE INDEX IF NOT EXISTS idx_trusted_qa_question_text ON trusted_qa USING gin(to_tsvector('chinese', question));
+
+-- 生成问答表索引
+CREATE INDEX IF NOT EXISTS idx_generated_qa_verified ON generated_qa(is_verified);
+CREATE INDEX IF NOT EXISTS idx_generated_qa_confidence ON generated_qa(confidence_score);
+
+-- 聊天会话表索引
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_user ON chat_sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_expires ON chat_sessions(expires_at);
+
+-- 聊天消息表索引
+CREATE INDEX IF NOT EXISTS idx_chat_messages_session ON chat_messages(session_id);
+CREATE INDEX IF NOT EXISTS idx_chat_messages_created ON chat_messages(created_at);
+
+-- 用户反馈表索引
+CREATE INDEX IF NOT EXISTS idx_user_feedback_session ON user_feedback(session_id);
+CREATE INDEX IF NOT EXISTS idx_user_feedback_rating ON user_feedback(rating);
+"""
+
 class DatabaseManager:
     """数据库管理器"""
     
@@ -44,108 +169,7 @@ class DatabaseManager:
         """创建数据库表结构"""
         try:
             async with self.pool.acquire() as conn:
-                # 创建文档表
-                await conn.execute("""
-                    CREATE TABLE IF NOT EXISTS documents (
-                        id VARCHAR(100) PRIMARY KEY,
-                        filename VARCHAR(255) NOT NULL,
-                        file_path TEXT NOT NULL,
-                        document_type VARCHAR(50) DEFAULT 'raw',
-                        content TEXT,
-                        metadata JSONB DEFAULT '{}',
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # 创建FAQ表
-                await conn.execute("""
-                    CREATE TABLE IF NOT EXISTS faq (
-                        id SERIAL PRIMARY KEY,
-                        question TEXT NOT NULL,
-                        answer TEXT NOT NULL,
-                        category VARCHAR(100),
-                        tags JSONB DEFAULT '[]',
-                        is_active BOOLEAN DEFAULT true,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # 创建可信问答表
-                await conn.execute("""
-                    CREATE TABLE IF NOT EXISTS trusted_qa (
-                        id SERIAL PRIMARY KEY,
-                        question TEXT NOT NULL,
-                        answer TEXT NOT NULL,
-                        source VARCHAR(255),
-                        confidence_score FLOAT DEFAULT 0.0,
-                        tags JSONB DEFAULT '[]',
-                        is_verified BOOLEAN DEFAULT false,
-                        verifier VARCHAR(100),
-                        verified_at TIMESTAMP,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # 创建生成问答表
-                await conn.execute("""
-                    CREATE TABLE IF NOT EXISTS generated_qa (
-                        id SERIAL PRIMARY KEY,
-                        question TEXT NOT NULL,
-                        answer TEXT NOT NULL,
-                        source VARCHAR(255),
-                        confidence_score FLOAT DEFAULT 0.0,
-                        metadata JSONB DEFAULT '{}',
-                        is_verified BOOLEAN,
-                        verifier VARCHAR(100),
-                        verification_notes TEXT,
-                        verified_at TIMESTAMP,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # 创建聊天会话表
-                await conn.execute("""
-                    CREATE TABLE IF NOT EXISTS chat_sessions (
-                        id VARCHAR(100) PRIMARY KEY,
-                        user_id VARCHAR(100),
-                        session_data JSONB DEFAULT '{}',
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        expires_at TIMESTAMP
-                    )
-                """)
-                
-                # 创建聊天消息表
-                await conn.execute("""
-                    CREATE TABLE IF NOT EXISTS chat_messages (
-                        id SERIAL PRIMARY KEY,
-                        session_id VARCHAR(100) NOT NULL,
-                        role VARCHAR(20) NOT NULL,
-                        content TEXT NOT NULL,
-                        metadata JSONB DEFAULT '{}',
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE
-                    )
-                """)
-                
-                # 创建用户反馈表
-                await conn.execute("""
-                    CREATE TABLE IF NOT EXISTS user_feedback (
-                        id SERIAL PRIMARY KEY,
-                        session_id VARCHAR(100),
-                        message_id INTEGER,
-                        rating INTEGER CHECK (rating >= 1 AND rating <= 5),
-                        comment TEXT,
-                        metadata JSONB DEFAULT '{}',
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (session_id) REFERENCES chat_sessions(id) ON DELETE SET NULL,
-                        FOREIGN KEY (message_id) REFERENCES chat_messages(id) ON DELETE SET NULL
-                    )
-                """)
+                await conn.execute(_SCHEMA_DDL)
                 
                 # 创建索引
                 await self._create_indexes(conn)
@@ -159,35 +183,7 @@ class DatabaseManager:
     async def _create_indexes(self, conn):
         """创建数据库索引"""
         try:
-            # 文档表索引
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_type ON documents(document_type)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_created ON documents(created_at)")
-            
-            # FAQ表索引
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_faq_category ON faq(category)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_faq_active ON faq(is_active)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_faq_question_text ON faq USING gin(to_tsvector('chinese', question))")
-            
-            # 可信问答表索引
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_trusted_qa_verified ON trusted_qa(is_verified)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_trusted_qa_confidence ON trusted_qa(confidence_score)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_trusted_qa_question_text ON trusted_qa USING gin(to_tsvector('chinese', question))")
-            
-            # 生成问答表索引
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_generated_qa_verified ON generated_qa(is_verified)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_generated_qa_confidence ON generated_qa(confidence_score)")
-            
-            # 聊天会话表索引
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_user ON chat_sessions(user_id)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_expires ON chat_sessions(expires_at)")
-            
-            # 聊天消息表索引
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_session ON chat_messages(session_id)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_created ON chat_messages(created_at)")
-            
-            # 用户反馈表索引
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_user_feedback_session ON user_feedback(session_id)")
-            await conn.execute("CREATE INDEX IF NOT EXISTS idx_user_feedback_rating ON user_feedback(rating)")
+            await conn.execute(_INDEX_DDL)
             
             logger.info("数据库索引创建完成")
             
@@ -2,14 +2,32 @@
 日志配置管理
 """
 
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 from datetime import datetime
 from .config import settings
 
+# 后台写日志的监听器
+_queue_listener = None
+
+def _stop_listener():
+    """停止后台日志监听器并写出剩余日志"""
+    global _queue_listener
+    if _queue_listener:
+        _queue_listener.stop()
+        _queue_listener = None
+
 def setup_logger():
     """设置日志配置"""
+    global _queue_listener
+    
+    # 不采集线程/进程信息，减少每条日志的记录开销
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
     
     # 创建日志目录
     log_dir = os.path.dirname(settings.LOG_FILE)
@@ -21,6 +39,7 @@ def setup_logger():
     
     # 清除现有处理器
     logger.handlers.clear()
+    _stop_listener()
     
     # 创建格式器
     formatter = logging.Formatter(
@@ -32,7 +51,6 @@ def setup_logger():
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
     
     # 文件处理器（带轮转）
     file_handler = logging.handlers.RotatingFileHandler(
@@ -43,7 +61,6 @@ def setup_logger():
     )
     file_handler.setLevel(getattr(logging, settings.LOG_LEVEL.upper()))
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
     
     # 错误日志单独处理器
     error_log_file = settings.LOG_FILE.replace('.log', '_error.log')
@@ -55,7 +72,18 @@ def setup_logger():
     )
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(formatter)
-    logger.addHandler(error_handler)
+    
+    # 通过队列交给后台线程格式化并写入，日志I/O不阻塞请求处理
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _queue_listener = logging.handlers.QueueListener(
+        log_queue,
+        console_handler,
+        file_handler,
+        error_handler,
+        respect_handler_level=True
+    )
+    _queue_listener.start()
     
     # 设置第三方库日志级别
     logging.getLogger('uvicorn').setLevel(logging.INFO)
@@ -66,8 +94,8 @@ def setup_logger():
     
     return logger
 
-# 初始化日志
-setup_logger()
+# 日志在应用启动（worker fork之后）时由setup_logger()初始化，导入时不打开日志文件
+atexit.register(_stop_listener)
 
 # 创建应用专用日志器
 def get_logger(name: str) -> logging.Logger:
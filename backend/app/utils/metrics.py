@@ -2,11 +2,14 @@
 监控指标收集
 """
 
+import os
 import time
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 from fastapi import Request, Response
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, Gauge, generate_latest, multiprocess, CONTENT_TYPE_LATEST
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +28,8 @@ REQUEST_DURATION = Histogram(
 
 ACTIVE_SESSIONS = Gauge(
     'socialwise_active_sessions',
-    'Number of active sessions'
+    'Number of active sessions',
+    multiprocess_mode='livesum'
 )
 
 ASR_REQUESTS = Counter(
@@ -52,6 +56,10 @@ QUERY_DURATION = Histogram(
     ['intent']
 )
 
+# 已绑定标签的指标子项缓存，避免每个请求重复执行labels()查找
+_REQ_COUNTERS: Dict[Tuple[str, str, str], Any] = {}
+_REQ_DURATIONS: Dict[Tuple[str, str], Any] = {}
+
 async def metrics_middleware(request: Request, call_next):
     """监控中间件"""
     start_time = time.time()
@@ -67,8 +75,17 @@ async def metrics_middleware(request: Request, call_next):
     endpoint = request.url.path
     status = str(response.status_code)
     
-    REQUEST_COUNT.labels(method=method, endpoint=endpoint, status=status).inc()
-    REQUEST_DURATION.labels(method=method, endpoint=endpoint).observe(process_time)
+    count_key = (method, endpoint, status)
+    counter = _REQ_COUNTERS.get(count_key)
+    if counter is None:
+        counter = _REQ_COUNTERS.setdefault(count_key, REQUEST_COUNT.labels(*count_key))
+    counter.inc()
+    
+    duration_key = (method, endpoint)
+    histogram = _REQ_DURATIONS.get(duration_key)
+    if histogram is None:
+        histogram = _REQ_DURATIONS.setdefault(duration_key, REQUEST_DURATION.labels(*duration_key))
+    histogram.observe(process_time)
     
     # 添加响应头
     response.headers["X-Process-Time"] = str(process_time)
@@ -97,4 +114,9 @@ def update_active_sessions(count: int):
 
 async def get_metrics():
     """获取Prometheus指标"""
+    # 多worker部署时（设置了PROMETHEUS_MULTIPROC_DIR）汇总各进程写出的指标文件
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
     return generate_latest()
\ No newline at end of file
@@ -4,6 +4,7 @@
 
 from pydantic_settings import BaseSettings
 from typing import Optional
+from functools import lru_cache
 import os
 
 class Settings(BaseSettings):
@@ -22,6 +23,8 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = "socialwise"
     POSTGRES_USER: str = "postgres"
     POSTGRES_PASSWORD: str = "password"
+    DB_POOL_SIZE: int = 20  # 常驻连接数，按并发查询量设置
+    DB_MAX_OVERFLOW: int = 40  # 峰值时允许额外创建的连接数
     
     @property
     def DATABASE_URL(self) -> str:
@@ -31,22 +34,39 @@ class Settings(BaseSettings):
     MILVUS_HOST: str = "localhost"
     MILVUS_PORT: int = 19530
     MILVUS_COLLECTION_NAME: str = "socialwise_vectors"
+    # HNSW / IVF_FLAT / IVF_SQ8 / IVF_PQ
+    # IVF_SQ8将向量按维度量化为int8，索引内存约为float32的1/4，召回率损失很小
+    # 仅对尚无索引的集合生效：已建索引的集合切换类型需运行 scripts/rebuild_milvus_index.py 重建
+    MILVUS_INDEX_TYPE: str = "HNSW"
+    # HNSW建图参数：M为每个节点的邻居数，efConstruction为建图时的候选队列长度
+    # 仅在建索引时生效：已有索引不会随重启变更，修改后需运行 scripts/rebuild_milvus_index.py 重建
+    MILVUS_HNSW_M: int = 16
+    MILVUS_HNSW_EF_CONSTRUCTION: int = 200
+    MILVUS_PQ_M: int = 48  # IVF_PQ子量化器数量，需整除向量维度1536
+    MILVUS_NPROBE: int = 16  # IVF检索时探查的聚类数，需小于nlist
+    # HNSW检索时的候选队列长度（需≥top_k）。增大可提升召回率、延迟随之近似线性增长；
+    # 召回率下降时可逐步调高（如64→128→256）
+    MILVUS_EF_SEARCH: int = 64
     
     # 通义千问配置
     DASHSCOPE_API_KEY: Optional[str] = None
     QWEN_MODEL: str = "qwen-turbo-latest"
     QWEN_EMBEDDING_MODEL: str = "text-embedding-v1"
+    QWEN_RERANK_MODEL: str = "gte-rerank"
+    QWEN_MAX_CONCURRENCY: int = 16  # 同时进行的生成请求上限，按账号限流配额设置
     
     # 科大讯飞配置
     IFLYTEK_APP_ID: Optional[str] = None
     IFLYTEK_API_KEY: Optional[str] = None
     IFLYTEK_API_SECRET: Optional[str] = None
+    IFLYTEK_MAX_CONCURRENCY: int = 32  # 同时进行的ASR/TTS会话上限
     
     # 语音配置
     ASR_LANGUAGE: str = "zh_cn"
     TTS_VOICE: str = "xiaoyan"
     TTS_SPEED: float = 1.0
     AUDIO_SAMPLE_RATE: int = 16000
+    AUDIO_FORMAT: str = "wav"
     
     # 文件存储配置
     UPLOAD_DIR: str = "data/uploads"
@@ -57,6 +77,7 @@ class Settings(BaseSettings):
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
+    REDIS_PASSWORD: Optional[str] = None
     SESSION_EXPIRE: int = 3600  # 1小时
     
     # 监控配置
@@ -66,15 +87,24 @@ class Settings(BaseSettings):
     # 日志配置
     LOG_LEVEL: str = "INFO"
     LOG_FILE: str = "logs/socialwise.log"
+    LOG_MAX_SIZE: int = 10 * 1024 * 1024  # 10MB
+    LOG_BACKUP_COUNT: int = 5
     
     class Config:
         env_file = ".env"
         case_sensitive = True
+        frozen = True  # 配置加载后只读，可在线程/worker间安全共享
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """获取配置快照（.env只解析、校验一次）"""
+    return Settings()
 
 # 创建全局配置实例
-settings = Settings()
+settings = get_settings()
 
-# 确保必要的目录存在
-os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-os.makedirs(settings.DOCUMENT_DIR, exist_ok=True)
-os.makedirs("logs", exist_ok=True)
\ No newline at end of file
+def ensure_dirs():
+    """确保必要的目录存在（应用启动时调用一次）"""
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    os.makedirs(settings.DOCUMENT_DIR, exist_ok=True)
+    os.makedirs(os.path.dirname(settings.LOG_FILE), exist_ok=True)
\ No newline at end of file
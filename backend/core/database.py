@@ -4,7 +4,10 @@
 
 import asyncpg
 import asyncio
-from sqlalchemy import create_engine, MetaData
+import hashlib
+import math
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import MetaData, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
@@ -15,14 +18,22 @@ from backend.core.config import settings
 
 logger = logging.getLogger(__name__)
 
-# SQLAlchemy配置
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# SQLAlchemy配置（仅使用异步引擎）
 Base = declarative_base()
 
 # 异步数据库引擎
 async_engine = create_async_engine(
-    settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
+    settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://"),
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    pool_timeout=10,
+    connect_args={
+        # 问答查询都很短，关闭JIT避免编译开销；复用预编译语句
+        "server_settings": {"jit": "off"},
+        "statement_cache_size": 1024
+    }
 )
 AsyncSessionLocal = sessionmaker(
     async_engine, class_=AsyncSession, expire_on_commit=False
@@ -61,6 +72,7 @@ async def create_tables():
                 answer TEXT NOT NULL,
                 category VARCHAR(100),
                 keywords TEXT[],
+                is_active BOOLEAN DEFAULT TRUE,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
@@ -77,6 +89,9 @@ async def create_tables():
                 confidence_score FLOAT DEFAULT 1.0,
                 verified_by VARCHAR(100),
                 verified_at TIMESTAMP,
+                human_verified BOOLEAN DEFAULT FALSE,
+                tags JSONB,
+                is_active BOOLEAN DEFAULT TRUE,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
@@ -96,6 +111,18 @@ async def create_tables():
             )
         """)
         
+        # 创建文档片段表
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS document_chunks (
+                id SERIAL PRIMARY KEY,
+                document_id INTEGER REFERENCES documents(id),
+                chunk_text TEXT NOT NULL,
+                chunk_index INTEGER,
+                vector_id VARCHAR(100),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
         # 创建会话表
         await conn.execute("""
             CREATE TABLE IF NOT EXISTS chat_sessions (
@@ -128,50 +155,225 @@ async def create_tables():
                 timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        
+        # 旧库的faq/trusted_qa表缺少状态列，需先补齐再建部分索引
+        await conn.execute("ALTER TABLE faq ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE")
+        await conn.execute("ALTER TABLE trusted_qa ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE")
+        await conn.execute("ALTER TABLE trusted_qa ADD COLUMN IF NOT EXISTS human_verified BOOLEAN DEFAULT FALSE")
+        
+        # 问题文本三元组索引及关键词GIN索引，用于库内相似度预筛选
+        # 检索只查有效条目，索引均为仅含is_active行的部分索引
+        await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS faq_q_trgm ON faq USING gin (question gin_trgm_ops)
+            WHERE is_active
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS faq_kw_gin ON faq USING gin (keywords)
+            WHERE is_active
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS trusted_qa_q_trgm ON trusted_qa USING gin (question gin_trgm_ops)
+            WHERE is_active
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS faq_active ON faq (id) WHERE is_active
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS tqa_active_verified ON trusted_qa (id)
+            WHERE is_active AND human_verified
+        """)
+        
+        # 同一文件只入库一次
+        await conn.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS documents_hash ON documents (content_hash)
+        """)
+        
+        # 历史库中以文本存储的JSON列迁移为jsonb，并建立标签GIN索引
+        await conn.execute(_JSONB_MIGRATION_DDL)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS tqa_tags_gin ON trusted_qa USING gin (tags)
+        """)
+
+# 将text类型的JSON列迁移为jsonb（旧数据不保证是合法JSON，按JSON字符串保留）
+_JSONB_MIGRATION_DDL = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'chat_messages' AND column_name = 'source_info'
+                 AND data_type = 'text') THEN
+        ALTER TABLE chat_messages ALTER COLUMN source_info TYPE jsonb USING to_jsonb(source_info);
+    END IF;
+    ALTER TABLE trusted_qa ADD COLUMN IF NOT EXISTS tags JSONB;
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'trusted_qa' AND column_name = 'tags'
+                 AND data_type = 'text') THEN
+        ALTER TABLE trusted_qa ALTER COLUMN tags TYPE jsonb USING to_jsonb(tags);
+    END IF;
+END $$;
+"""
+
+# Milvus集合（init_milvus中加载后缓存）
+MILVUS_COLLECTION: Optional[Collection] = None
+# 集合上实际存在的索引类型（可能与配置不同，检索参数按实际类型构建）
+MILVUS_ACTIVE_INDEX_TYPE: Optional[str] = None
+
+def content_hash(data: bytes) -> str:
+    """计算文件内容哈希（BLAKE2b-256，64位十六进制）"""
+    return hashlib.blake2b(data, digest_size=32).hexdigest()
+
+async def find_document_by_hash(digest: str) -> Optional[int]:
+    """按内容哈希查找已入库文档，返回文档ID
+    
+    入库前先调用：命中时直接复用已有文档片段和向量，不再重复调用嵌入接口和写入Milvus。
+    """
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(
+            text("SELECT id FROM documents WHERE content_hash = :h"), {"h": digest}
+        )).scalar()
+
+# 文档片段批量写入列及每批行数
+_CHUNK_COLUMNS = ['document_id', 'chunk_text', 'chunk_index', 'vector_id']
+_CHUNK_COPY_BATCH = 10000
+
+async def bulk_insert_chunks(records: Iterable[Tuple]) -> int:
+    """批量写入文档片段
+    
+    通过asyncpg二进制COPY写入document_chunks，每条记录为
+    (document_id, chunk_text, chunk_index, vector_id)，按批提交在同一事务内。
+    返回写入行数。
+    """
+    records = list(records)
+    async with async_engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        driver_conn = raw.driver_connection
+        async with driver_conn.transaction():
+            for i in range(0, len(records), _CHUNK_COPY_BATCH):
+                await driver_conn.copy_records_to_table(
+                    'document_chunks',
+                    records=records[i:i + _CHUNK_COPY_BATCH],
+                    columns=_CHUNK_COLUMNS
+                )
+    logger.info(f"批量写入文档片段 {len(records)} 条")
+    return len(records)
+
+async def insert_chat_history(rows: List[Tuple]):
+    """批量写入对话历史
+    
+    每条记录为 (session_id, message_type, content, timestamp)。直接使用连接池中的
+    asyncpg连接executemany，先补齐会话记录以满足外键约束。
+    """
+    async with async_engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        driver_conn = raw.driver_connection
+        async with driver_conn.transaction():
+            await driver_conn.executemany(
+                "INSERT INTO chat_sessions (session_id) VALUES ($1) ON CONFLICT (session_id) DO NOTHING",
+                [(session_id,) for session_id in {row[0] for row in rows}]
+            )
+            await driver_conn.executemany(
+                "INSERT INTO chat_history (session_id, message_type, content, timestamp) VALUES ($1, $2, $3, $4)",
+                rows
+            )
+
+# 支持的向量索引类型
+_INDEX_TYPES = ("HNSW", "IVF_FLAT", "IVF_SQ8", "IVF_PQ")
+
+def _ivf_nlist(num_entities: int) -> int:
+    """根据向量数量计算IVF聚类数"""
+    return min(max(int(4 * math.sqrt(num_entities)), 128), 65536)
+
+def _index_params(num_entities: int) -> dict:
+    """构建向量索引参数（IVF类索引的nlist按 4·sqrt(N) 随数据量取值）"""
+    if settings.MILVUS_INDEX_TYPE not in _INDEX_TYPES:
+        raise ValueError(f"不支持的向量索引类型: {settings.MILVUS_INDEX_TYPE}")
+    
+    if settings.MILVUS_INDEX_TYPE == "HNSW":
+        return {
+            "metric_type": "COSINE",
+            "index_type": "HNSW",
+            "params": {
+                "M": settings.MILVUS_HNSW_M,
+                "efConstruction": settings.MILVUS_HNSW_EF_CONSTRUCTION
+            }
+        }
+    
+    params = {"nlist": _ivf_nlist(num_entities)}
+    if settings.MILVUS_INDEX_TYPE == "IVF_PQ":
+        # 乘积量化：1536维切分为m段、每段8bit编码，m需整除向量维度
+        params.update({"m": settings.MILVUS_PQ_M, "nbits": 8})
+    
+    return {
+        "metric_type": "COSINE",
+        "index_type": settings.MILVUS_INDEX_TYPE,
+        "params": params
+    }
+
+def _open_milvus_collection() -> Collection:
+    """连接Milvus并打开（不存在时创建）知识库集合"""
+    connections.connect(
+        alias="default",
+        host=settings.MILVUS_HOST,
+        port=settings.MILVUS_PORT
+    )
+    
+    # 定义集合schema
+    fields = [
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+        FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
+        FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=1536),  # 通义千问嵌入维度
+        FieldSchema(name="source_type", dtype=DataType.VARCHAR, max_length=50),
+        FieldSchema(name="source_id", dtype=DataType.INT64),
+        FieldSchema(name="metadata", dtype=DataType.JSON)
+    ]
+    
+    schema = CollectionSchema(
+        fields=fields,
+        description="SocialWise知识库向量存储"
+    )
+    
+    return Collection(
+        name=settings.MILVUS_COLLECTION_NAME,
+        schema=schema,
+        using='default'
+    )
 
 async def init_milvus():
     """初始化Milvus向量数据库"""
     try:
-        # 连接Milvus
-        connections.connect(
-            alias="default",
-            host=settings.MILVUS_HOST,
-            port=settings.MILVUS_PORT
-        )
-        
-        # 定义集合schema
-        fields = [
-            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-            FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
-            FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=1536),  # 通义千问嵌入维度
-            FieldSchema(name="source_type", dtype=DataType.VARCHAR, max_length=50),
-            FieldSchema(name="source_id", dtype=DataType.INT64),
-            FieldSchema(name="metadata", dtype=DataType.JSON)
-        ]
-        
-        schema = CollectionSchema(
-            fields=fields,
-            description="SocialWise知识库向量存储"
-        )
-        
-        # 创建集合
-        collection = Collection(
-            name=settings.MILVUS_COLLECTION_NAME,
-            schema=schema,
-            using='default'
-        )
-        
-        # 创建索引
-        index_params = {
-            "metric_type": "COSINE",
-            "index_type": "IVF_FLAT",
-            "params": {"nlist": 1024}
-        }
+        collection = _open_milvus_collection()
         
-        collection.create_index(
-            field_name="vector",
-            index_params=index_params
-        )
+        # 仅在集合尚无索引时建索引；已有索引的参数变更需通过rebuild_milvus_index显式重建，
+        # 否则按当前数据量算出的nlist与已有索引不一致，Milvus会拒绝并导致启动失败
+        if not collection.has_index():
+            collection.create_index(
+                field_name="vector",
+                index_params=_index_params(collection.num_entities)
+            )
+        
+        index_info = collection.indexes[0].params
+        index_type = index_info["index_type"]
+        if index_type != settings.MILVUS_INDEX_TYPE:
+            logger.warning(
+                f"已有向量索引类型为{index_type}，与配置的{settings.MILVUS_INDEX_TYPE}不一致，"
+                f"继续使用已有索引；如需迁移请运行 scripts/rebuild_milvus_index.py"
+            )
+        elif index_type == "HNSW":
+            # 建图参数只在重建索引时生效，配置变更后提示重建
+            wanted = _index_params(collection.num_entities)["params"]
+            built_params = index_info.get("params", index_info)
+            built = {k: int(built_params[k]) for k in wanted if k in built_params}
+            if built != wanted:
+                logger.warning(
+                    f"已有HNSW索引参数{built}与配置{wanted}不一致，"
+                    f"继续使用已有索引；如需生效请运行 scripts/rebuild_milvus_index.py"
+                )
+        
+        # 加载到内存并缓存集合对象，检索时不再重复解析schema
+        collection.load()
+        global MILVUS_COLLECTION, MILVUS_ACTIVE_INDEX_TYPE
+        MILVUS_COLLECTION = collection
+        MILVUS_ACTIVE_INDEX_TYPE = index_type
         
         logger.info("Milvus初始化完成")
         
@@ -179,6 +381,34 @@ async def init_milvus():
         logger.error(f"Milvus初始化失败: {e}")
         raise
 
+def milvus_search_params() -> dict:
+    """构建与当前索引类型匹配的检索参数"""
+    if (MILVUS_ACTIVE_INDEX_TYPE or settings.MILVUS_INDEX_TYPE) == "HNSW":
+        return {"metric_type": "COSINE", "params": {"ef": settings.MILVUS_EF_SEARCH}}
+    return {"metric_type": "COSINE", "params": {"nprobe": settings.MILVUS_NPROBE}}
+
+def rebuild_milvus_index():
+    """重建向量索引
+    
+    删除已有索引后按配置的索引类型和当前数据量重建，是变更索引类型（如由
+    IVF_FLAT迁移到HNSW）的唯一途径。IVF类索引的聚类中心和PQ码本在建索引时训练，
+    数据量明显增长后（至少为nlist的数倍）也应调用此函数重新训练。
+    由维护脚本 scripts/rebuild_milvus_index.py 调用，自行连接并打开集合。
+    """
+    collection = MILVUS_COLLECTION or _open_milvus_collection()
+    collection.release()
+    collection.drop_index()
+    collection.create_index(
+        field_name="vector",
+        index_params=_index_params(collection.num_entities)
+    )
+    collection.load()
+    global MILVUS_ACTIVE_INDEX_TYPE
+    MILVUS_ACTIVE_INDEX_TYPE = settings.MILVUS_INDEX_TYPE
+    logger.info("Milvus向量索引重建完成")
+
 def get_milvus_collection():
     """获取Milvus集合"""
-    return Collection(settings.MILVUS_COLLECTION_NAME)
\ No newline at end of file
+    if MILVUS_COLLECTION is None:
+        raise RuntimeError("Milvus集合未初始化，请先调用init_milvus")
+    return MILVUS_COLLECTION
\ No newline at end of file
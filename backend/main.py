@@ -9,31 +9,64 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse, StreamingResponse
 from contextlib import asynccontextmanager
 import uvicorn
+import atexit
 import logging
+import logging.handlers
+import queue
 from pathlib import Path
+from typing import Optional
 
 from backend.api import asr, tts, query, knowledge
-from backend.core.config import settings
+from backend.core.config import settings, ensure_dirs
 from backend.core.database import init_db
 from backend.services.monitoring import setup_prometheus_metrics
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# 日志：请求路径上只将日志记录入队，格式化与输出在后台线程中完成
+# 监听线程在lifespan中启动（worker fork之后），导入时不创建线程
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+def _setup_logging():
+    """配置根日志器并启动后台日志监听器"""
+    global _log_listener
+    _stop_logging()
+    
+    log_queue = queue.SimpleQueue()
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(
+        logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    )
+    logging.basicConfig(
+        level=logging.INFO,
+        handlers=[logging.handlers.QueueHandler(log_queue)],
+        force=True
+    )
+    _log_listener = logging.handlers.QueueListener(log_queue, console_handler)
+    _log_listener.start()
+
+def _stop_logging():
+    """停止后台日志监听器并写出剩余日志"""
+    global _log_listener
+    if _log_listener:
+        _log_listener.stop()
+        _log_listener = None
+
+atexit.register(_stop_logging)
 logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时初始化
+    _setup_logging()
     logger.info("启动 SocialWise 应用...")
+    ensure_dirs()
     await init_db()
     setup_prometheus_metrics()
     yield
-    # 关闭时清理
+    # 关闭时清理：写入尚在队列中的对话历史
     logger.info("关闭 SocialWise 应用...")
+    await query.qa_service.flush_chat_history()
+    _stop_logging()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -2,6 +2,7 @@
 知识库数据模型
 """
 from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from backend.core.database import Base
@@ -15,6 +16,7 @@ class Document(Base):
     file_path = Column(String(500), nullable=False)
     file_type = Column(String(50), nullable=False)  # pdf, txt, docx
     file_size = Column(Integer)
+    content_hash = Column(String(64), unique=True)  # 文件内容哈希，用于去重
     upload_time = Column(DateTime(timezone=True), server_default=func.now())
     processed = Column(Boolean, default=False)
     category = Column(String(100))
@@ -66,7 +68,7 @@ class TrustedQA(Base):
     verified_by = Column(String(100))  # 确认人
     verified_at = Column(DateTime(timezone=True))
     category = Column(String(100))
-    tags = Column(Text)  # JSON格式的标签
+    tags = Column(JSONB)  # 标签列表
     usage_count = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -98,7 +100,7 @@ class ChatMessage(Base):
     audio_file = Column(String(500))  # 语音文件路径
     response_time = Column(Float)  # 响应时间（秒）
     confidence_score = Column(Float)  # 回答置信度
-    source_info = Column(Text)  # JSON格式的来源信息
+    source_info = Column(JSONB)  # 来源信息
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # 关联会话
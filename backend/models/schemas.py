@@ -2,7 +2,7 @@
 数据模型定义
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -27,6 +27,8 @@ class ASRRequest(BaseModel):
 
 class ASRResponse(BaseModel):
     """语音识别响应"""
+    model_config = ConfigDict(frozen=True)
+    
     text: str = Field(..., description="识别的文本")
     confidence: float = Field(..., description="置信度")
 
@@ -38,6 +40,8 @@ class TTSRequest(BaseModel):
 
 class TTSResponse(BaseModel):
     """语音合成响应"""
+    model_config = ConfigDict(frozen=True)
+    
     audio_data: bytes = Field(..., description="合成的音频数据")
     format: str = Field(default="wav", description="音频格式")
 
@@ -50,21 +54,27 @@ class QueryRequest(BaseModel):
 
 class QueryResponse(BaseModel):
     """问答响应"""
+    model_config = ConfigDict(frozen=True)
+    
     answer: str = Field(..., description="回答内容")
-    sources: List[Dict[str, Any]] = Field(default=[], description="参考来源")
+    sources: List[Dict[str, Any]] = Field(default_factory=list, description="参考来源")
     confidence: float = Field(..., description="置信度")
     session_id: str = Field(..., description="会话ID")
 
 class ChatMessage(BaseModel):
     """聊天消息"""
+    model_config = ConfigDict(frozen=True)
+    
     type: MessageType = Field(..., description="消息类型")
     content: str = Field(..., description="消息内容")
     timestamp: datetime = Field(default_factory=datetime.now, description="时间戳")
 
 class ChatHistory(BaseModel):
     """聊天历史"""
+    model_config = ConfigDict(frozen=True)
+    
     session_id: str = Field(..., description="会话ID")
-    messages: List[ChatMessage] = Field(default=[], description="消息列表")
+    messages: List[ChatMessage] = Field(default_factory=list, description="消息列表")
 
 # 知识库相关模型
 class FAQItem(BaseModel):
@@ -73,7 +83,7 @@ class FAQItem(BaseModel):
     question: str = Field(..., description="问题")
     answer: str = Field(..., description="答案")
     category: Optional[str] = Field(None, description="分类")
-    keywords: List[str] = Field(default=[], description="关键词")
+    keywords: List[str] = Field(default_factory=list, description="关键词")
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
@@ -103,11 +113,13 @@ class DocumentInfo(BaseModel):
 
 class VectorSearchResult(BaseModel):
     """向量搜索结果"""
+    model_config = ConfigDict(frozen=True)
+    
     text: str = Field(..., description="文本内容")
     score: float = Field(..., description="相似度分数")
     source_type: SourceType = Field(..., description="来源类型")
     source_id: int = Field(..., description="来源ID")
-    metadata: Dict[str, Any] = Field(default={}, description="元数据")
+    metadata: Dict[str, Any] = Field(default_factory=dict, description="元数据")
 
 # 系统监控相关模型
 class SystemMetric(BaseModel):
@@ -118,14 +130,18 @@ class SystemMetric(BaseModel):
 
 class HealthStatus(BaseModel):
     """健康状态"""
+    model_config = ConfigDict(frozen=True)
+    
     status: str = Field(..., description="状态")
     service: str = Field(..., description="服务名")
     timestamp: datetime = Field(default_factory=datetime.now, description="时间戳")
-    details: Dict[str, Any] = Field(default={}, description="详细信息")
+    details: Dict[str, Any] = Field(default_factory=dict, description="详细信息")
 
 # 文件上传相关模型
 class FileUploadResponse(BaseModel):
     """文件上传响应"""
+    model_config = ConfigDict(frozen=True)
+    
     filename: str = Field(..., description="文件名")
     file_path: str = Field(..., description="文件路径")
     file_size: int = Field(..., description="文件大小")
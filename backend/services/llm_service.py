@@ -3,48 +3,180 @@
 """
 import asyncio
 import json
-from typing import List, Dict, Optional, Tuple
+import logging
+from functools import lru_cache
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 import dashscope
 from dashscope import Generation, TextEmbedding
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.vectorstores import Milvus
 from langchain.embeddings.base import Embeddings
+from sqlalchemy import text
 
 from backend.core.config import settings
-from backend.models.knowledge import TrustedQA, FAQ, DocumentChunk
-from backend.core.database import SessionLocal
+from backend.core.database import AsyncSessionLocal, get_milvus_collection, milvus_search_params
+
+logger = logging.getLogger(__name__)
 
 # 配置DashScope
 dashscope.api_key = settings.DASHSCOPE_API_KEY
 
+# 文本嵌入批量参数：DashScope单次请求最多25条文本
+_EMBED_BATCH_SIZE = 25
+_EMBED_CONCURRENCY = 8
+
+# 历史对话的token预算
+_HISTORY_TOKEN_BUDGET = 2048
+
+# 系统提示词模板
+_SYSTEM_PROMPT = """你是"社保智答/SocialWise"智能助手，专门回答社会保障和福利服务相关问题。
+
+请遵循以下原则：
+1. 基于提供的上下文信息回答问题
+2. 如果上下文中没有相关信息，请诚实说明
+3. 回答要准确、简洁、易懂
+4. 使用友好、专业的语调
+5. 如需要，可以提供具体的操作步骤
+
+上下文信息：
+{context}
+
+请回答用户的问题。"""
+
+# 知识来源优先级：可信QA对 > FAQ > 文档片段
+_SOURCE_PRIORITY = {"trusted_qa": 0, "faq": 1, "document": 2}
+_SOURCE_LABELS = {"trusted_qa": "可信问答对", "faq": "FAQ", "document": "文档片段"}
+
+# 三元组相似度预筛选（question % :q 走pg_trgm GIN索引，仅返回top_k行）
+_TRGM_QUERIES = {
+    "faq": text("""
+        SELECT id, question, answer, similarity(question, :q) AS score
+        FROM faq
+        WHERE is_active AND (question % :q OR keywords @> ARRAY[:q])
+        ORDER BY score DESC
+        LIMIT :k
+    """),
+    "trusted_qa": text("""
+        SELECT id, question, answer, similarity(question, :q) AS score
+        FROM trusted_qa
+        WHERE is_active AND human_verified AND question % :q
+        ORDER BY score DESC
+        LIMIT :k
+    """)
+}
+
+# 向量命中的FAQ/可信QA对需在PostgreSQL中仍为有效（可信QA对还需经人工确认）
+_ACTIVE_ID_QUERIES = {
+    "faq": text("SELECT id FROM faq WHERE is_active AND id = ANY(:ids)"),
+    "trusted_qa": text("SELECT id FROM trusted_qa WHERE is_active AND human_verified AND id = ANY(:ids)")
+}
+
+# 句末标点，流式回答按句输出便于下游逐句合成语音
+SENTENCE_ENDINGS = frozenset("。！？；\n")
+
+class SentenceSplitter:
+    """按句末标点切分增量文本"""
+    
+    def __init__(self):
+        self._chars: List[str] = []
+    
+    def feed(self, delta: str) -> List[str]:
+        """追加增量文本，返回其中已完整的句子（去除首尾空白，丢弃空句）"""
+        sentences = []
+        for char in delta:
+            self._chars.append(char)
+            if char in SENTENCE_ENDINGS:
+                sentence = "".join(self._chars).strip()
+                self._chars.clear()
+                if sentence:
+                    sentences.append(sentence)
+        return sentences
+    
+    def flush(self) -> List[str]:
+        """返回剩余的不完整句子"""
+        rest = "".join(self._chars).strip()
+        self._chars.clear()
+        return [rest] if rest else []
+
+async def stream_generation(**kwargs) -> AsyncIterator[str]:
+    """流式调用通义千问，逐段产出增量文本
+    
+    流式调用返回同步迭代器，逐块在线程中拉取以免阻塞事件循环。
+    """
+    responses = iter(Generation.call(
+        result_format='message',
+        stream=True,
+        incremental_output=True,
+        **kwargs
+    ))
+    
+    while True:
+        response = await asyncio.to_thread(next, responses, None)
+        if response is None:
+            break
+        if response.status_code != 200:
+            raise Exception(f"LLM调用失败: {response.message}")
+        delta = response.output.choices[0].message.content
+        if delta:
+            yield delta
+
 class QwenEmbeddings(Embeddings):
     """通义千问嵌入模型"""
     
     def __init__(self, model: str = "text-embedding-v1"):
         self.model = model
+        # 查询嵌入LRU缓存（同一实例模型固定，按规范化后的文本缓存）
+        self._embed_query_cached = lru_cache(maxsize=4096)(self._embed_query)
+    
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """批量嵌入一组文本（不超过单次请求上限）"""
+        response = TextEmbedding.call(
+            model=self.model,
+            input=texts
+        )
+        if response.status_code == 200:
+            items = sorted(response.output['embeddings'], key=lambda e: e['text_index'])
+            return [item['embedding'] for item in items]
+        else:
+            raise Exception(f"嵌入生成失败: {response.message}")
     
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """嵌入文档"""
         embeddings = []
-        for text in texts:
-            response = TextEmbedding.call(
-                model=self.model,
-                input=text
-            )
-            if response.status_code == 200:
-                embeddings.append(response.output['embeddings'][0]['embedding'])
-            else:
-                raise Exception(f"嵌入生成失败: {response.message}")
+        for i in range(0, len(texts), _EMBED_BATCH_SIZE):
+            embeddings.extend(self._embed_batch(texts[i:i + _EMBED_BATCH_SIZE]))
         return embeddings
     
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """并发批量嵌入文档"""
+        semaphore = asyncio.Semaphore(_EMBED_CONCURRENCY)
+        
+        async def embed(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await asyncio.to_thread(self._embed_batch, batch)
+        
+        batches = await asyncio.gather(*(
+            embed(texts[i:i + _EMBED_BATCH_SIZE])
+            for i in range(0, len(texts), _EMBED_BATCH_SIZE)
+        ))
+        return [embedding for batch in batches for embedding in batch]
+    
     def embed_query(self, text: str) -> List[float]:
         """嵌入查询"""
+        return list(self._embed_query_cached(text.strip().lower()))
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        """异步嵌入查询（在线程中调用，不阻塞事件循环）"""
+        return await asyncio.to_thread(self.embed_query, text)
+    
+    def _embed_query(self, text: str) -> Tuple[float, ...]:
+        """调用DashScope嵌入查询文本"""
         response = TextEmbedding.call(
             model=self.model,
             input=text
         )
         if response.status_code == 200:
-            return response.output['embeddings'][0]['embedding']
+            return tuple(response.output['embeddings'][0]['embedding'])
         else:
             raise Exception(f"查询嵌入失败: {response.message}")
 
@@ -59,6 +191,61 @@ class QwenLLMService:
             chunk_overlap=50,
             separators=["\n\n", "\n", "。", "！", "？", "；", "，"]
         )
+        # 在{context}处预先切分提示词，生成时直接拼接
+        self._prompt_prefix, self._prompt_suffix = _SYSTEM_PROMPT.split("{context}")
+        self._tokenizer = self._load_tokenizer()
+        # 按消息内容缓存token数：历史消息每次请求都从数据库重新构建，不能缓存在消息对象上
+        self._content_token_len = lru_cache(maxsize=4096)(self._count_tokens)
+    
+    def _load_tokenizer(self):
+        """加载本地分词器，不可用时按字符数估算token"""
+        try:
+            return dashscope.get_tokenizer(self.model)
+        except Exception as e:
+            logger.warning(f"加载分词器失败，按字符数估算token: {str(e)}")
+            return None
+    
+    def _count_tokens(self, content: str) -> int:
+        """计算文本token数"""
+        return len(self._tokenizer.encode(content)) if self._tokenizer else len(content)
+    
+    def _token_len(self, msg: Dict) -> int:
+        """计算消息token数（按内容缓存，不修改传入的消息）"""
+        return self._content_token_len(msg["content"])
+    
+    def _fit_history(self, history: List[Dict], budget: int = _HISTORY_TOKEN_BUDGET) -> List[Dict]:
+        """从最近一条开始倒序累加token数，保留预算内的历史对话"""
+        used = 0
+        start = len(history)
+        for i in range(len(history) - 1, -1, -1):
+            used += self._token_len(history[i])
+            if used > budget:
+                break
+            start = i
+        return [{"role": msg["role"], "content": msg["content"]} for msg in history[start:]]
+    
+    @staticmethod
+    def estimate_confidence(answer: str) -> float:
+        """简单的置信度计算（基于回答长度）"""
+        return min(0.9, len(answer) / 200 + 0.3)
+    
+    def _build_messages(
+        self,
+        question: str,
+        context: str = "",
+        history: List[Dict] = None
+    ) -> List[Dict]:
+        """构建对话消息"""
+        messages = [
+            {"role": "system", "content": self._prompt_prefix + context + self._prompt_suffix}
+        ]
+        
+        # 添加历史对话（按token预算截取最近的对话）
+        if history:
+            messages.extend(self._fit_history(history))
+        
+        messages.append({"role": "user", "content": question})
+        return messages
     
     async def generate_response(
         self, 
@@ -69,32 +256,11 @@ class QwenLLMService:
         """生成回答"""
         try:
             # 构建提示词
-            system_prompt = """你是"社保智答/SocialWise"智能助手，专门回答社会保障和福利服务相关问题。
-
-请遵循以下原则：
-1. 基于提供的上下文信息回答问题
-2. 如果上下文中没有相关信息，请诚实说明
-3. 回答要准确、简洁、易懂
-4. 使用友好、专业的语调
-5. 如需要，可以提供具体的操作步骤
-
-上下文信息：
-{context}
-
-请回答用户的问题。"""
-            
-            messages = [
-                {"role": "system", "content": system_prompt.format(context=context)}
-            ]
-            
-            # 添加历史对话
-            if history:
-                messages.extend(history[-6:])  # 保留最近6轮对话
+            messages = self._build_messages(question, context, history)
             
-            messages.append({"role": "user", "content": question})
-            
-            # 调用通义千问
-            response = Generation.call(
+            # 调用通义千问（同步SDK，在线程中执行）
+            response = await asyncio.to_thread(
+                Generation.call,
                 model=self.model,
                 messages=messages,
                 result_format='message',
@@ -105,79 +271,112 @@ class QwenLLMService:
             
             if response.status_code == 200:
                 answer = response.output.choices[0].message.content
-                # 简单的置信度计算（基于回答长度和关键词匹配）
-                confidence = min(0.9, len(answer) / 200 + 0.3)
-                return answer, confidence
+                return answer, self.estimate_confidence(answer)
             else:
                 raise Exception(f"LLM调用失败: {response.message}")
                 
         except Exception as e:
             return f"抱歉，我暂时无法回答这个问题。错误信息：{str(e)}", 0.1
     
-    async def search_knowledge(self, question: str, top_k: int = 3) -> List[Dict]:
-        """搜索知识库"""
-        db = SessionLocal()
+    async def _search_trigram(self, source_type: str, question: str, top_k: int) -> List[Dict]:
+        """在PostgreSQL中按问题文本三元组相似度检索FAQ/可信QA对"""
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(
+                _TRGM_QUERIES[source_type], {"q": question, "k": top_k}
+            )).all()
+        
+        return [{
+            "type": source_type,
+            "source_id": row.id,
+            "confidence": row.score,
+            "source": _SOURCE_LABELS[source_type],
+            "question": row.question,
+            "answer": row.answer
+        } for row in rows]
+    
+    async def _search_vector(self, question: str, top_k: int) -> List[Dict]:
+        """Milvus向量检索"""
+        query_vector = await self.embeddings.aembed_query(question)
+        
+        hits = (await asyncio.to_thread(
+            get_milvus_collection().search,
+            data=[query_vector],
+            anns_field="vector",
+            param=milvus_search_params(),
+            limit=top_k,
+            expr='source_type in ["trusted_qa", "faq", "document"]',
+            output_fields=["text", "source_type", "source_id", "metadata"]
+        ))[0]
+        
         results = []
+        for hit in hits:
+            source_type = hit.entity.get("source_type")
+            text = hit.entity.get("text")
+            metadata = hit.entity.get("metadata") or {}
+            result = {
+                "type": source_type,
+                "source_id": hit.entity.get("source_id"),
+                "confidence": hit.score,
+                "source": _SOURCE_LABELS[source_type]
+            }
+            if source_type == "document":
+                result["content"] = text
+            else:
+                result["question"] = metadata.get("question", text)
+                result["answer"] = metadata.get("answer", "")
+            results.append(result)
+        return await self._filter_active(results)
+    
+    async def _filter_active(self, results: List[Dict]) -> List[Dict]:
+        """剔除已停用的FAQ及未经确认/已停用的可信QA对"""
+        ids = {source_type: [r["source_id"] for r in results if r["type"] == source_type]
+               for source_type in _ACTIVE_ID_QUERIES}
+        if not any(ids.values()):
+            return results
         
-        try:
-            # 1. 优先搜索可信QA对
-            trusted_qas = db.query(TrustedQA).filter(
-                TrustedQA.is_active == True,
-                TrustedQA.human_verified == True
-            ).all()
-            
-            for qa in trusted_qas:
-                if self._calculate_similarity(question, qa.question) > 0.7:
-                    results.append({
-                        "type": "trusted_qa",
-                        "question": qa.question,
-                        "answer": qa.answer,
-                        "confidence": 0.9,
-                        "source": "可信问答对"
-                    })
-            
-            # 2. 搜索FAQ
-            if len(results) < top_k:
-                faqs = db.query(FAQ).filter(FAQ.is_active == True).all()
-                for faq in faqs:
-                    if self._calculate_similarity(question, faq.question) > 0.6:
-                        results.append({
-                            "type": "faq",
-                            "question": faq.question,
-                            "answer": faq.answer,
-                            "confidence": 0.8,
-                            "source": "FAQ"
-                        })
-            
-            # 3. 向量搜索文档片段
-            if len(results) < top_k:
-                try:
-                    # 这里需要集成Milvus进行向量搜索
-                    # 暂时使用简单的文本匹配
-                    chunks = db.query(DocumentChunk).all()
-                    for chunk in chunks:
-                        if any(word in chunk.chunk_text for word in question.split()):
-                            results.append({
-                                "type": "document",
-                                "content": chunk.chunk_text,
-                                "confidence": 0.6,
-                                "source": "文档片段"
-                            })
-                except Exception as e:
-                    print(f"向量搜索失败: {e}")
-            
-            return results[:top_k]
-            
-        finally:
-            db.close()
-    
-    def _calculate_similarity(self, text1: str, text2: str) -> float:
-        """简单的文本相似度计算"""
-        words1 = set(text1)
-        words2 = set(text2)
-        intersection = words1.intersection(words2)
-        union = words1.union(words2)
-        return len(intersection) / len(union) if union else 0
+        active = set()
+        async with AsyncSessionLocal() as session:
+            for source_type, source_ids in ids.items():
+                if source_ids:
+                    rows = (await session.execute(
+                        _ACTIVE_ID_QUERIES[source_type], {"ids": source_ids}
+                    )).scalars().all()
+                    active.update((source_type, source_id) for source_id in rows)
+        
+        return [
+            r for r in results
+            if r["type"] not in _ACTIVE_ID_QUERIES or (r["type"], r["source_id"]) in active
+        ]
+    
+    async def search_knowledge(self, question: str, top_k: int = 3) -> List[Dict]:
+        """搜索知识库（可信QA对/FAQ库内预筛选 + Milvus向量检索）"""
+        # 三路检索并发执行：两路各自使用连接池中的独立连接，向量检索在线程中执行
+        # 任一路失败（如Milvus或嵌入接口不可用）时记录日志，仍合并其余成功的检索结果
+        sources = ("trusted_qa", "faq", "vector")
+        outcomes = await asyncio.gather(
+            self._search_trigram("trusted_qa", question, top_k),
+            self._search_trigram("faq", question, top_k),
+            self._search_vector(question, top_k),
+            return_exceptions=True
+        )
+        
+        hits = []
+        for source, outcome in zip(sources, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"{source}检索失败: {str(outcome)}")
+            else:
+                hits.extend(outcome)
+        
+        # 同一条目可能同时被两路命中，保留置信度较高的一条
+        merged = {}
+        for result in hits:
+            key = (result["type"], result["source_id"])
+            if key not in merged or result["confidence"] > merged[key]["confidence"]:
+                merged[key] = result
+        
+        # 命中结果中可信QA对优先，其次FAQ，最后文档片段
+        results = sorted(merged.values(), key=lambda r: (_SOURCE_PRIORITY[r["type"]], -r["confidence"]))
+        return results[:top_k]
 
 # 全局LLM服务实例
 llm_service = QwenLLMService()
\ No newline at end of file
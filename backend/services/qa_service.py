@@ -5,31 +5,176 @@
 
 import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncGenerator, List, Dict, Any, Optional, Set
+import numpy as np
 from sqlalchemy.ext.asyncio import AsyncSession
 import dashscope
-from dashscope import Generation
+from dashscope import Generation, TextReRank
 import json
 
 from backend.core.config import settings
+from backend.core.database import AsyncSessionLocal, insert_chat_history
 from backend.services.knowledge_service import KnowledgeService
-from backend.models.schemas import ChatMessage, VectorSearchResult
+from backend.services.llm_service import QwenEmbeddings, SentenceSplitter, stream_generation
+from backend.models.schemas import ChatMessage, MessageType, VectorSearchResult
 
 logger = logging.getLogger(__name__)
 
 # 配置通义千问
 dashscope.api_key = settings.DASHSCOPE_API_KEY
 
+# 语义缓存参数：余弦相似度阈值、最大条目数、过期时间（秒）
+_CACHE_THRESHOLD = 0.95
+_CACHE_SIZE = 10000
+_CACHE_TTL = 24 * 3600
+# 缓存命中时略降置信度，提示答案可能并非针对本次问题实时生成
+_CACHE_CONFIDENCE_DECAY = 0.98
+
+# 召回候选数及重排序后保留数
+_RETRIEVE_TOP_K = 50
+_RERANK_TOP_N = 5
+
+# 检索平均相似度分段阈值及对应置信度
+_CONFIDENCE_THRESHOLDS = np.array([0.4, 0.6, 0.8])
+_CONFIDENCE_LEVELS = np.array([0.3, 0.5, 0.7, 0.9])
+
+# 生成回答时携带的历史消息条数
+_HISTORY_MESSAGES = 6
+
+# 对话历史批量写入间隔（秒）
+_HISTORY_FLUSH_INTERVAL = 0.1
+
+# 后台保存任务引用
+_background_tasks: Set[asyncio.Task] = set()
+
+# 生成失败时的兜底回答（不写入缓存）
+_GENERATION_UNAVAILABLE = "抱歉，AI服务暂时不可用，请稍后重试。"
+_GENERATION_ERROR = "抱歉，生成答案时出现错误，请稍后重试。"
+
+class SemanticCache:
+    """语义缓存
+    
+    以归一化的问题向量为键缓存回答，查询时取内积最大（余弦相似度最高）的条目，
+    超过阈值即命中。条目按LRU淘汰并带过期时间；写操作加锁，读操作无锁。
+    """
+    
+    def __init__(self, threshold: float = _CACHE_THRESHOLD, capacity: int = _CACHE_SIZE, ttl: float = _CACHE_TTL):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.ttl = ttl
+        self._vectors: Optional[np.ndarray] = None  # (capacity, dim)，首次写入时分配
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # 槽位 -> (回答, 过期时间)
+        self._lock: Optional[asyncio.Lock] = None  # 首次写入时在事件循环内创建
+    
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def get(self, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """查找语义相近的已缓存回答"""
+        if not self._entries:
+            return None
+        
+        scores = self._vectors @ self._normalize(embedding)
+        scores[~self._valid] = -1.0
+        slot = int(np.argmax(scores))
+        if scores[slot] < self.threshold:
+            return None
+        
+        entry = self._entries.get(slot)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        
+        self._entries.move_to_end(slot)
+        return entry[0]
+    
+    async def put(self, embedding: List[float], payload: Dict[str, Any]):
+        """写入缓存，满时淘汰最久未使用的条目"""
+        vector = self._normalize(embedding)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+            
+            # 优先复用过期槽位，其次空闲槽位，最后淘汰LRU条目
+            now = time.monotonic()
+            expired = [slot for slot, (_, expires_at) in self._entries.items() if expires_at < now]
+            for slot in expired:
+                del self._entries[slot]
+                self._valid[slot] = False
+            
+            if len(self._entries) < self.capacity:
+                slot = int(np.argmin(self._valid))
+            else:
+                slot, _ = self._entries.popitem(last=False)
+            
+            self._vectors[slot] = vector
+            self._valid[slot] = True
+            self._entries[slot] = (payload, now + self.ttl)
+
+class _ChatHistoryWriter:
+    """对话历史批量写入器
+    
+    写入请求进入队列，后台任务每隔固定时间将队列中的记录一次性executemany提交；
+    队列空闲时任务退出，下次写入时再启动。
+    """
+    
+    def __init__(self, interval: float = _HISTORY_FLUSH_INTERVAL):
+        self.interval = interval
+        self._queue: Optional[asyncio.Queue] = None  # 首次写入时在事件循环内创建
+        self._task: Optional[asyncio.Task] = None
+    
+    def put(self, session_id: str, question: str, answer: str, asked_at: Optional[datetime] = None):
+        """追加一轮问答（提问时间为收到问题时，回答时间为入队时）"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        answered_at = datetime.now()
+        self._queue.put_nowait((session_id, "user", question, asked_at or answered_at))
+        self._queue.put_nowait((session_id, "assistant", answer, answered_at))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def flush(self):
+        """等待已入队的记录全部写入"""
+        if self._task is not None and not self._task.done():
+            await self._task
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            rows = []
+            while not self._queue.empty():
+                rows.append(self._queue.get_nowait())
+            if not rows:
+                return
+            
+            try:
+                await insert_chat_history(rows)
+            except Exception as e:
+                logger.error("批量写入对话历史失败: %s", e)
+
 class QAService:
     """智能问答服务类"""
     
     def __init__(self):
         self.knowledge_service = KnowledgeService()
         self.model = settings.QWEN_MODEL
+        self.embeddings = QwenEmbeddings(settings.QWEN_EMBEDDING_MODEL)
+        self.cache = SemanticCache()
+        self._history_writer = _ChatHistoryWriter()
+        # 并发生成请求数与DashScope限流配额对齐
+        # （服务实例在模块导入时创建，信号量须在事件循环内首次使用时创建）
+        self._llm_semaphore: Optional[asyncio.Semaphore] = None
         
         # 系统提示词
-        self.system_prompt = """
-你是"社保智答/SocialWise"智能助手，专门回答社会保险相关问题。
+        self.system_prompt = """你是"社保智答/SocialWise"智能助手，专门回答社会保险相关问题。
 
 你的职责：
 1. 准确回答用户关于社保、医保、养老保险、失业保险、工伤保险、生育保险等问题
@@ -43,8 +188,21 @@ class QAService:
 - 友好性：使用温和、专业的语气
 - 简洁性：重点突出，条理清晰
 
-如果用户问题超出社保范围，请礼貌地引导回到社保话题。
-"""
+如果用户问题超出社保范围，请礼貌地引导回到社保话题。"""
+        
+        # 用户消息模板（系统提示词单独作为system消息发送）
+        self._prompt_tmpl = """参考信息：
+{context}
+
+用户问题：{question}
+
+请基于参考信息回答用户问题。如果参考信息不足，请基于你的知识给出合理回答，并提醒用户验证信息的准确性。"""
+    
+    def _llm_limiter(self) -> asyncio.Semaphore:
+        """获取生成请求限流器"""
+        if self._llm_semaphore is None:
+            self._llm_semaphore = asyncio.Semaphore(settings.QWEN_MAX_CONCURRENCY)
+        return self._llm_semaphore
     
     async def get_answer(self, question: str, session_id: str, db: AsyncSession) -> Dict[str, Any]:
         """
@@ -59,36 +217,53 @@ class QAService:
             包含答案、置信度、来源等信息的字典
         """
         try:
-            logger.info(f"处理问题: {question}")
+            logger.info("处理问题: %s", question)
+            asked_at = datetime.now()
             
-            # 1. 知识库检索
-            search_results = await self.knowledge_service.search_knowledge(
-                query=question,
-                top_k=5,
-                db=db
+            # 0. 语义缓存：相近问题直接返回已生成的回答
+            # 有历史对话时回答可能依赖上下文（如“那第二个呢？”），不读写缓存
+            embedding, history = await asyncio.gather(
+                self.embeddings.aembed_query(question),
+                self._load_history(session_id)
             )
+            cached = None if history else self.cache.get(embedding)
+            if cached is not None:
+                self._save_in_background(question, cached["answer"], session_id, db, asked_at)
+                return {
+                    **cached,
+                    "confidence": cached["confidence"] * _CACHE_CONFIDENCE_DECAY,
+                    "session_id": session_id
+                }
+            
+            # 1. 知识库检索（含重排序）
+            search_results = await self._retrieve(question, db)
             
             # 2. 构建上下文
             context = self._build_context(search_results)
             
             # 3. 生成回答
-            answer = await self._generate_answer(question, context)
+            answer = await self._generate_answer(question, context, history)
             
             # 4. 计算置信度
             confidence = self._calculate_confidence(search_results, answer)
             
-            # 5. 保存对话历史
-            await self._save_chat_history(question, answer, session_id, db)
+            # 5. 后台保存对话历史，不阻塞响应
+            self._save_in_background(question, answer, session_id, db, asked_at)
             
-            return {
+            result = {
                 "answer": answer,
                 "confidence": confidence,
-                "sources": [{"title": r.title, "score": r.score} for r in search_results],
-                "session_id": session_id
+                "sources": [{"title": r.title, "score": r.score} for r in search_results]
             }
             
+            # 6. 写入语义缓存（生成失败的兜底回答不缓存）
+            if not history and answer not in (_GENERATION_UNAVAILABLE, _GENERATION_ERROR):
+                await self.cache.put(embedding, result)
+            
+            return {**result, "session_id": session_id}
+            
         except Exception as e:
-            logger.error(f"问答处理失败: {str(e)}")
+            logger.error("问答处理失败: %s", e)
             return {
                 "answer": "抱歉，我暂时无法回答您的问题，请稍后重试或联系人工客服。",
                 "confidence": 0.0,
@@ -96,6 +271,151 @@ class QAService:
                 "session_id": session_id
             }
     
+    async def stream_answer(self, question: str, session_id: str, db: AsyncSession) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        流式获取问题答案
+        
+        按句产出 {"type": "sentence", "text": ...}，下游可在首句生成后即开始语音合成；
+        结束时产出 {"type": "done", "answer", "confidence", "sources", "session_id"}，
+        出错时产出 {"type": "error", "text": ...}。
+        """
+        try:
+            logger.info("处理问题(流式): %s", question)
+            asked_at = datetime.now()
+            splitter = SentenceSplitter()
+            
+            # 语义缓存命中时按句返回已生成的回答（有历史对话时不读写缓存）
+            embedding, history = await asyncio.gather(
+                self.embeddings.aembed_query(question),
+                self._load_history(session_id)
+            )
+            cached = None if history else self.cache.get(embedding)
+            if cached is not None:
+                for sentence in splitter.feed(cached["answer"]) + splitter.flush():
+                    yield {"type": "sentence", "text": sentence}
+                self._save_in_background(question, cached["answer"], session_id, db, asked_at)
+                yield {
+                    "type": "done",
+                    **cached,
+                    "confidence": cached["confidence"] * _CACHE_CONFIDENCE_DECAY,
+                    "session_id": session_id
+                }
+                return
+            
+            search_results = await self._retrieve(question, db)
+            context = self._build_context(search_results)
+            
+            parts = []
+            async for delta in self._stream_answer(question, context, history):
+                parts.append(delta)
+                for sentence in splitter.feed(delta):
+                    yield {"type": "sentence", "text": sentence}
+            for sentence in splitter.flush():
+                yield {"type": "sentence", "text": sentence}
+            
+            answer = "".join(parts).strip()
+            self._save_in_background(question, answer, session_id, db, asked_at)
+            
+            result = {
+                "answer": answer,
+                "confidence": self._calculate_confidence(search_results, answer),
+                "sources": [{"title": r.title, "score": r.score} for r in search_results]
+            }
+            if not history:
+                await self.cache.put(embedding, result)
+            
+            yield {"type": "done", **result, "session_id": session_id}
+            
+        except Exception as e:
+            logger.error("流式问答处理失败: %s", e)
+            yield {"type": "error", "text": "抱歉，我暂时无法回答您的问题，请稍后重试或联系人工客服。"}
+    
+    async def stream_answer_audio(
+        self,
+        question: str,
+        session_id: str,
+        db: AsyncSession,
+        speech_service,
+        voice: str = "xiaoyan"
+    ) -> AsyncGenerator[bytes, None]:
+        """流式语音回答：每生成一句即提交语音合成，按句序输出音频，合成与后续生成并行"""
+        pending: asyncio.Queue = asyncio.Queue()
+        tts_tasks: List[asyncio.Task] = []
+        
+        async def _produce():
+            try:
+                async for event in self.stream_answer(question, session_id, db):
+                    if event["type"] in ("sentence", "error"):
+                        task = asyncio.create_task(
+                            speech_service.text_to_speech(event["text"], voice)
+                        )
+                        tts_tasks.append(task)
+                        await pending.put(task)
+            finally:
+                await pending.put(None)
+        
+        producer = asyncio.create_task(_produce())
+        try:
+            while True:
+                task = await pending.get()
+                if task is None:
+                    break
+                yield await task
+        finally:
+            # 客户端断开或合成出错时，取消尚未输出的合成任务以释放连接配额，并回收其异常
+            producer.cancel()
+            for task in tts_tasks:
+                task.cancel()
+            await asyncio.gather(producer, *tts_tasks, return_exceptions=True)
+    
+    async def _retrieve(self, question: str, db: AsyncSession) -> List[VectorSearchResult]:
+        """知识库检索，结果经重排序后返回"""
+        search_results = await self.knowledge_service.search_knowledge(
+            query=question,
+            top_k=_RETRIEVE_TOP_K,
+            db=db
+        )
+        
+        # 重排序，仅保留最相关的候选
+        return await self._rerank(question, search_results)
+    
+    async def _load_history(self, session_id: str) -> List[ChatMessage]:
+        """获取历史对话（使用独立会话，可与问题向量计算并发执行）"""
+        async with AsyncSessionLocal() as session:
+            return await self.get_chat_history(session_id, session)
+    
+    def _save_in_background(self, question: str, answer: str, session_id: str, db: AsyncSession, asked_at: Optional[datetime] = None):
+        """在后台任务中保存对话历史，保留任务引用防止被回收"""
+        task = asyncio.create_task(self._save_chat_history(question, answer, session_id, db, asked_at))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    
+    async def _rerank(self, question: str, search_results: List[VectorSearchResult]) -> List[VectorSearchResult]:
+        """使用重排序模型对召回结果重新排序，返回前_RERANK_TOP_N条"""
+        if len(search_results) <= 1:
+            return search_results
+        
+        try:
+            response = await asyncio.to_thread(
+                TextReRank.call,
+                model=settings.QWEN_RERANK_MODEL,
+                query=question,
+                documents=[r.content for r in search_results],
+                top_n=_RERANK_TOP_N,
+                return_documents=False
+            )
+            
+            if response.status_code == 200:
+                return [search_results[item.index] for item in response.output.results]
+            else:
+                logger.error("重排序调用失败: %s", response.message)
+                
+        except Exception as e:
+            logger.error("重排序失败: %s", e)
+        
+        # 重排序不可用时按原始向量相似度截取
+        return search_results[:_RERANK_TOP_N]
+    
     def _build_context(self, search_results: List[VectorSearchResult]) -> str:
         """构建上下文信息"""
         if not search_results:
@@ -107,37 +427,64 @@ class QAService:
         
         return "\n\n".join(context_parts)
     
-    async def _generate_answer(self, question: str, context: str) -> str:
-        """使用通义千问生成答案"""
+    def _build_messages(self, question: str, context: str, history: List[ChatMessage] = None) -> List[Dict[str, str]]:
+        """构建对话消息"""
+        messages = [{"role": "system", "content": self.system_prompt}]
+        
+        # 添加最近的历史对话
+        for msg in (history or [])[-_HISTORY_MESSAGES:]:
+            role = "user" if msg.type == MessageType.USER else "assistant"
+            messages.append({"role": role, "content": msg.content})
+        
+        messages.append(
+            {"role": "user", "content": self._prompt_tmpl.format(context=context, question=question)}
+        )
+        return messages
+    
+    async def _generate_answer(self, question: str, context: str, history: List[ChatMessage] = None) -> str:
+        """使用通义千问生成答案
+        
+        系统提示词作为独立的system消息发送，且每次调用保持逐字节不变（不拼接时间戳等
+        动态内容），服务端可复用其前缀缓存；参考信息和用户问题只放在user消息中。
+        """
         try:
-            prompt = f"""
-{self.system_prompt}
-
-参考信息：
-{context}
-
-用户问题：{question}
-
-请基于参考信息回答用户问题。如果参考信息不足，请基于你的知识给出合理回答，并提醒用户验证信息的准确性。
-"""
+            messages = self._build_messages(question, context, history)
             
-            response = Generation.call(
-                model=self.model,
-                prompt=prompt,
-                max_tokens=1000,
-                temperature=0.3,
-                top_p=0.8
-            )
+            # 并发请求各自在线程中调用，由信号量限制同时在途的请求数
+            async with self._llm_limiter():
+                response = await asyncio.to_thread(
+                    Generation.call,
+                    model=self.model,
+                    messages=messages,
+                    result_format='message',
+                    max_tokens=1000,
+                    temperature=0.3,
+                    top_p=0.8
+                )
             
             if response.status_code == 200:
-                return response.output.text.strip()
+                return response.output.choices[0].message.content.strip()
             else:
-                logger.error(f"通义千问调用失败: {response.message}")
-                return "抱歉，AI服务暂时不可用，请稍后重试。"
+                logger.error("通义千问调用失败: %s", response.message)
+                return _GENERATION_UNAVAILABLE
                 
         except Exception as e:
-            logger.error(f"生成答案失败: {str(e)}")
-            return "抱歉，生成答案时出现错误，请稍后重试。"
+            logger.error("生成答案失败: %s", e)
+            return _GENERATION_ERROR
+    
+    async def _stream_answer(self, question: str, context: str, history: List[ChatMessage] = None) -> AsyncGenerator[str, None]:
+        """使用通义千问流式生成答案，逐段产出增量文本"""
+        messages = self._build_messages(question, context, history)
+        
+        async with self._llm_limiter():
+            async for delta in stream_generation(
+                model=self.model,
+                messages=messages,
+                max_tokens=1000,
+                temperature=0.3,
+                top_p=0.8
+            ):
+                yield delta
     
     def _calculate_confidence(self, search_results: List[VectorSearchResult], answer: str) -> float:
         """计算回答置信度"""
@@ -145,38 +492,28 @@ class QAService:
             return 0.3  # 无知识库支持时的基础置信度
         
         # 基于检索结果的相似度计算置信度
-        avg_score = sum(r.score for r in search_results) / len(search_results)
+        avg_score = np.fromiter((r.score for r in search_results), dtype=np.float64).mean()
         
-        # 置信度计算逻辑
-        if avg_score > 0.8:
-            confidence = 0.9
-        elif avg_score > 0.6:
-            confidence = 0.7
-        elif avg_score > 0.4:
-            confidence = 0.5
-        else:
-            confidence = 0.3
-        
-        return confidence
+        # 平均相似度按阈值分段映射为置信度（>0.8→0.9，>0.6→0.7，>0.4→0.5，否则0.3）
+        return float(_CONFIDENCE_LEVELS[np.searchsorted(_CONFIDENCE_THRESHOLDS, avg_score)])
     
-    async def _save_chat_history(self, question: str, answer: str, session_id: str, db: AsyncSession):
+    async def _save_chat_history(self, question: str, answer: str, session_id: str, db: AsyncSession, asked_at: Optional[datetime] = None):
         """保存对话历史"""
         try:
-            # 这里应该保存到数据库，暂时用日志记录
-            logger.info(f"保存对话历史 - 会话:{session_id}, 问题:{question[:50]}...")
-            
-            # TODO: 实现数据库保存逻辑
-            # chat_record = ChatHistory(
-            #     session_id=session_id,
-            #     question=question,
-            #     answer=answer,
-            #     created_at=datetime.utcnow()
-            # )
-            # db.add(chat_record)
-            # await db.commit()
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("保存对话历史 - 会话:%s, 问题:%s...", session_id, question[:50])
+            
+            # 写入请求入队，由后台任务批量提交
+            self._history_writer.put(session_id, question, answer, asked_at)
             
         except Exception as e:
-            logger.error(f"保存对话历史失败: {str(e)}")
+            logger.error("保存对话历史失败: %s", e)
+    
+    async def flush_chat_history(self):
+        """等待后台保存任务完成并写入队列中的对话历史（应用关闭时调用）"""
+        if _background_tasks:
+            await asyncio.gather(*_background_tasks, return_exceptions=True)
+        await self._history_writer.flush()
     
     async def get_chat_history(self, session_id: str, db: AsyncSession) -> List[ChatMessage]:
         """获取对话历史"""
@@ -186,16 +523,16 @@ class QAService:
             return []
             
         except Exception as e:
-            logger.error(f"获取对话历史失败: {str(e)}")
+            logger.error("获取对话历史失败: %s", e)
             return []
     
     async def clear_chat_history(self, session_id: str, db: AsyncSession) -> bool:
         """清除对话历史"""
         try:
             # TODO: 实现清除对话历史的逻辑
-            logger.info(f"清除会话历史: {session_id}")
+            logger.info("清除会话历史: %s", session_id)
             return True
             
         except Exception as e:
-            logger.error(f"清除对话历史失败: {str(e)}")
+            logger.error("清除对话历史失败: %s", e)
             return False
\ No newline at end of file
@@ -6,46 +6,97 @@
 import asyncio
 import logging
 import base64
+import binascii
 import json
 import websockets
 import ssl
 import hmac
-import hashlib
-from datetime import datetime
+import time
+from functools import lru_cache
 from urllib.parse import urlencode
-from typing import AsyncGenerator, Dict, Any
+from typing import AsyncGenerator, Dict, Any, Optional
 
 from backend.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# JSON编解码：优先使用orjson，未安装时回退标准库
+try:
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+    _loads = orjson.loads
+except ImportError:
+    _dumps = json.dumps
+    _loads = json.loads
+
+# 讯飞WebSocket共用的SSL上下文（模块加载时构建一次）
+_SSL_CTX = ssl.create_default_context()
+_SSL_CTX.check_hostname = False
+_SSL_CTX.verify_mode = ssl.CERT_NONE
+
+# 流式识别每帧1280字节，即16kHz/16bit下40ms的音频，按实时节奏发送
+_ASR_CHUNK_SIZE = 1280
+_ASR_CHUNK_INTERVAL = 0.04
+
 class SpeechService:
     """语音处理服务类"""
     
+    # 讯飞QPS配额全应用共享，所有实例共用同一个WebSocket会话限流器
+    # （Python 3.9的Semaphore创建时即绑定事件循环，须在运行中的事件循环内首次使用时创建）
+    _ws_semaphore: Optional[asyncio.Semaphore] = None
+    
     def __init__(self):
         self.app_id = settings.IFLYTEK_APP_ID
         self.api_key = settings.IFLYTEK_API_KEY
         self.api_secret = settings.IFLYTEK_API_SECRET
+        # 签名密钥只编码一次
+        self._api_secret_bytes = (self.api_secret or "").encode('utf-8')
         
         # 科大讯飞API配置
         self.asr_url = "wss://iat-api.xfyun.cn/v2/iat"
         self.tts_url = "wss://tts-api.xfyun.cn/v2/tts"
+        
+        # 认证URL缓存，键为 (base_url, 秒级时间戳)
+        self._auth_url_cached = lru_cache(maxsize=8)(self._build_auth_url)
+    
+    @classmethod
+    def _session_limiter(cls) -> asyncio.Semaphore:
+        """获取WebSocket会话限流器"""
+        if cls._ws_semaphore is None:
+            cls._ws_semaphore = asyncio.Semaphore(settings.IFLYTEK_MAX_CONCURRENCY)
+        return cls._ws_semaphore
+    
+    def _connect(self, auth_url: str):
+        """建立讯飞WebSocket连接"""
+        return websockets.connect(
+            auth_url,
+            ssl=_SSL_CTX,
+            ping_interval=20,
+            ping_timeout=10,
+            max_size=2**22  # TTS音频帧较大，放宽默认1MiB的帧上限
+        )
     
     def _generate_auth_url(self, base_url: str) -> str:
-        """生成认证URL"""
+        """生成认证URL（签名只随date的秒数变化，同一秒内复用）"""
+        return self._auth_url_cached(base_url, int(time.time()))
+    
+    def _build_auth_url(self, base_url: str, timestamp: int) -> str:
+        """按指定时间戳生成认证URL"""
         # 生成RFC1123格式的时间戳
-        now = datetime.now()
-        date = now.strftime('%a, %d %b %Y %H:%M:%S GMT')
+        date = time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(timestamp))
         
         # 拼接字符串
         signature_origin = f"host: ws-api.xfyun.cn\ndate: {date}\nGET /v2/iat HTTP/1.1"
         
         # 进行hmac-sha256进行加密
-        signature_sha = hmac.new(
-            self.api_secret.encode('utf-8'),
+        signature_sha = hmac.digest(
+            self._api_secret_bytes,
             signature_origin.encode('utf-8'),
-            digestmod=hashlib.sha256
-        ).digest()
+            'sha256'
+        )
         signature_sha = base64.b64encode(signature_sha).decode(encoding='utf-8')
         
         authorization_origin = f'api_key="{self.api_key}", algorithm="hmac-sha256", headers="host date request-line", signature="{signature_sha}"'
@@ -70,15 +121,11 @@ class SpeechService:
             # 生成认证URL
             auth_url = self._generate_auth_url(self.asr_url)
             
-            # WebSocket连接配置
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
             
-            result_text = ""
-            confidence = 0.0
+            text_parts = []
+            wps = []
             
-            async with websockets.connect(auth_url, ssl=ssl_context) as websocket:
+            async with self._session_limiter(), self._connect(auth_url) as websocket:
                 # 发送开始参数
                 start_params = {
                     "common": {
@@ -99,7 +146,7 @@ class SpeechService:
                     }
                 }
                 
-                await websocket.send(json.dumps(start_params))
+                await websocket.send(_dumps(start_params))
                 
                 # 发送结束标志
                 end_params = {
@@ -110,11 +157,11 @@ class SpeechService:
                         "encoding": "raw"
                     }
                 }
-                await websocket.send(json.dumps(end_params))
+                await websocket.send(_dumps(end_params))
                 
                 # 接收识别结果
                 async for message in websocket:
-                    data = json.loads(message)
+                    data = _loads(message)
                     
                     if data.get("code") != 0:
                         raise Exception(f"语音识别错误: {data.get('message', '未知错误')}")
@@ -124,82 +171,111 @@ class SpeechService:
                         if "ws" in result:
                             for ws in result["ws"]:
                                 for cw in ws["cw"]:
-                                    result_text += cw["w"]
-                                    confidence = max(confidence, cw.get("wp", 0) / 100.0)
+                                    text_parts.append(cw["w"])
+                                    wps.append(cw.get("wp", 0))
                     
                     if data.get("data", {}).get("status") == 2:
                         break
             
             return {
-                "text": result_text,
-                "confidence": confidence
+                "text": "".join(text_parts),
+                "confidence": max(wps, default=0) / 100.0
             }
             
         except Exception as e:
-            logger.error(f"语音识别失败: {e}")
+            logger.error("语音识别失败: %s", e)
             raise
     
     async def stream_speech_to_text(self, audio_data: bytes) -> AsyncGenerator[str, None]:
         """
         流式语音识别
         """
+        # 空音频不会发送任何帧（包括结束帧），服务端不会返回结果，直接返回
+        if not audio_data:
+            return
+        
         try:
             auth_url = self._generate_auth_url(self.asr_url)
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
             
-            async with websockets.connect(auth_url, ssl=ssl_context) as websocket:
-                # 分块发送音频数据
-                chunk_size = 1280  # 每次发送1280字节
+            async with self._session_limiter(), self._connect(auth_url) as websocket:
+                # 发送与接收并发进行：生产者按实时节奏发送音频块，消费者持续接收识别结果
+                queue: asyncio.Queue = asyncio.Queue()
                 
-                for i in range(0, len(audio_data), chunk_size):
-                    chunk = audio_data[i:i + chunk_size]
-                    status = 0 if i == 0 else 1
-                    if i + chunk_size >= len(audio_data):
-                        status = 2
-                    
-                    params = {
-                        "common": {
-                            "app_id": self.app_id
-                        },
-                        "business": {
-                            "language": settings.ASR_LANGUAGE,
-                            "domain": "iat",
-                            "accent": "mandarin"
-                        },
-                        "data": {
-                            "status": status,
-                            "format": "audio/L16;rate=16000",
-                            "audio": base64.b64encode(chunk).decode(),
-                            "encoding": "raw"
-                        }
-                    }
-                    
-                    await websocket.send(json.dumps(params))
-                    
-                    # 接收部分结果
+                async def _producer():
                     try:
-                        message = await asyncio.wait_for(websocket.recv(), timeout=1.0)
-                        data = json.loads(message)
-                        
-                        if "data" in data and "result" in data["data"]:
-                            result = data["data"]["result"]
-                            if "ws" in result:
-                                partial_text = ""
-                                for ws in result["ws"]:
-                                    for cw in ws["cw"]:
-                                        partial_text += cw["w"]
-                                
-                                if partial_text:
-                                    yield json.dumps({"text": partial_text, "final": status == 2})
+                        for i in range(0, len(audio_data), _ASR_CHUNK_SIZE):
+                            chunk = audio_data[i:i + _ASR_CHUNK_SIZE]
+                            status = 0 if i == 0 else 1
+                            if i + _ASR_CHUNK_SIZE >= len(audio_data):
+                                status = 2
+                            
+                            params = {
+                                "common": {
+                                    "app_id": self.app_id
+                                },
+                                "business": {
+                                    "language": settings.ASR_LANGUAGE,
+                                    "domain": "iat",
+                                    "accent": "mandarin"
+                                },
+                                "data": {
+                                    "status": status,
+                                    "format": "audio/L16;rate=16000",
+                                    "audio": base64.b64encode(chunk).decode(),
+                                    "encoding": "raw"
+                                }
+                            }
+                            
+                            await websocket.send(_dumps(params))
+                            if status != 2:
+                                await asyncio.sleep(_ASR_CHUNK_INTERVAL)
+                    except Exception:
+                        await queue.put(None)
+                        raise
+                
+                async def _consumer():
+                    try:
+                        async for message in websocket:
+                            data = _loads(message)
+                            
+                            if data.get("code") != 0:
+                                raise Exception(f"语音识别错误: {data.get('message', '未知错误')}")
+                            
+                            final = data.get("data", {}).get("status") == 2
+                            result = data.get("data", {}).get("result", {})
+                            partial_text = "".join(
+                                cw["w"] for ws in result.get("ws", []) for cw in ws["cw"]
+                            )
+                            
+                            if partial_text or final:
+                                await queue.put({"text": partial_text, "final": final})
+                            if final:
+                                break
+                    finally:
+                        await queue.put(None)
+                
+                producer = asyncio.create_task(_producer())
+                consumer = asyncio.create_task(_consumer())
+                try:
+                    while True:
+                        item = await queue.get()
+                        if item is None:
+                            break
+                        yield _dumps(item)
                     
-                    except asyncio.TimeoutError:
-                        continue
+                    # 任一协程异常结束时抛出其异常
+                    for task in (producer, consumer):
+                        if task.done() and not task.cancelled() and task.exception():
+                            raise task.exception()
+                finally:
+                    # 等待两个协程真正结束后再关闭连接，并回收其异常
+                    producer.cancel()
+                    consumer.cancel()
+                    await asyncio.gather(producer, consumer, return_exceptions=True)
                         
         except Exception as e:
-            logger.error(f"流式语音识别失败: {e}")
-            yield json.dumps({"error": str(e)})
+            logger.error("流式语音识别失败: %s", e)
+            yield _dumps({"error": str(e)})
     
     async def text_to_speech(self, text: str, voice: str = "xiaoyan", speed: float = 1.0) -> bytes:
         """
@@ -207,13 +283,10 @@ class SpeechService:
         """
         try:
             auth_url = self._generate_auth_url(self.tts_url)
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
             
-            audio_data = b""
+            audio_chunks = []
             
-            async with websockets.connect(auth_url, ssl=ssl_context) as websocket:
+            async with self._session_limiter(), self._connect(auth_url) as websocket:
                 params = {
                     "common": {
                         "app_id": self.app_id
@@ -234,25 +307,25 @@ class SpeechService:
                     }
                 }
                 
-                await websocket.send(json.dumps(params))
+                await websocket.send(_dumps(params))
                 
                 async for message in websocket:
-                    data = json.loads(message)
+                    data = _loads(message)
                     
                     if data.get("code") != 0:
                         raise Exception(f"语音合成错误: {data.get('message', '未知错误')}")
                     
                     if "data" in data and "audio" in data["data"]:
-                        audio_chunk = base64.b64decode(data["data"]["audio"])
-                        audio_data += audio_chunk
+                        audio_chunk = binascii.a2b_base64(data["data"]["audio"])
+                        audio_chunks.append(audio_chunk)
                     
                     if data.get("data", {}).get("status") == 2:
                         break
             
-            return audio_data
+            return b"".join(audio_chunks)
             
         except Exception as e:
-            logger.error(f"语音合成失败: {e}")
+            logger.error("语音合成失败: %s", e)
             raise
     
     async def stream_text_to_speech(self, text: str, voice: str = "xiaoyan", speed: float = 1.0) -> AsyncGenerator[bytes, None]:
@@ -261,11 +334,8 @@ class SpeechService:
         """
         try:
             auth_url = self._generate_auth_url(self.tts_url)
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
             
-            async with websockets.connect(auth_url, ssl=ssl_context) as websocket:
+            async with self._session_limiter(), self._connect(auth_url) as websocket:
                 params = {
                     "common": {
                         "app_id": self.app_id
@@ -286,21 +356,21 @@ class SpeechService:
                     }
                 }
                 
-                await websocket.send(json.dumps(params))
+                await websocket.send(_dumps(params))
                 
                 async for message in websocket:
-                    data = json.loads(message)
+                    data = _loads(message)
                     
                     if data.get("code") != 0:
                         raise Exception(f"语音合成错误: {data.get('message', '未知错误')}")
                     
                     if "data" in data and "audio" in data["data"]:
-                        audio_chunk = base64.b64decode(data["data"]["audio"])
+                        audio_chunk = binascii.a2b_base64(data["data"]["audio"])
                         yield audio_chunk
                     
                     if data.get("data", {}).get("status") == 2:
                         break
                         
         except Exception as e:
-            logger.error(f"流式语音合成失败: {e}")
+            logger.error("流式语音合成失败: %s", e)
             raise
\ No newline at end of file
@@ -0,0 +1,26 @@
+"""
+Milvus向量索引重建脚本
+
+应用启动时只为尚无索引的集合建索引，不会改动已有索引。变更MILVUS_INDEX_TYPE
+（如由旧版的IVF_FLAT迁移到HNSW），或数据量明显增长后需重新训练IVF聚类中心时，
+运行本脚本按当前配置和数据量删除并重建向量索引。
+重建期间集合会被释放，检索不可用，请在维护窗口执行。
+
+用法：
+    python scripts/rebuild_milvus_index.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.core.config import settings
+from backend.core.database import rebuild_milvus_index
+
+def main():
+    print(f"重建集合 {settings.MILVUS_COLLECTION_NAME} 的向量索引 ({settings.MILVUS_INDEX_TYPE})...")
+    rebuild_milvus_index()
+    print("完成")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Milvus检索参数调优脚本
+
+在留出评测集上用Optuna搜索 nprobe（IVF类索引）或 ef（HNSW索引），
+在 recall@5 ≥ 目标值 的约束下最小化单次检索的p95延迟，并将最优参数写入.env。
+
+评测集为JSONL文件，每行一个问答对：
+    {"question": "...", "source_type": "faq", "source_id": 12}
+
+用法：
+    pip install optuna
+    python scripts/tune_milvus.py --eval-file data/eval_qa.jsonl --trials 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+import optuna
+from pymilvus import Collection, connections
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.core.config import settings
+from backend.services.llm_service import QwenEmbeddings
+
+TOP_K = 5
+# 召回率每低于目标1个百分点，折算为10ms延迟惩罚
+RECALL_PENALTY = 1000
+
+def load_eval_set(path: str, sample: int) -> List[Dict]:
+    """加载评测集并随机抽样"""
+    with open(path, encoding="utf-8") as f:
+        pairs = [json.loads(line) for line in f if line.strip()]
+    if len(pairs) > sample:
+        pairs = random.Random(42).sample(pairs, sample)
+    return pairs
+
+def evaluate(
+    collection: Collection,
+    vectors: List[List[float]],
+    gold: List[Tuple[str, int]],
+    search_params: dict
+) -> Tuple[float, float]:
+    """逐条检索，返回 (p95延迟毫秒, recall@TOP_K)"""
+    latencies = []
+    hits_found = 0
+    for vector, target in zip(vectors, gold):
+        start = time.perf_counter()
+        hits = collection.search(
+            data=[vector],
+            anns_field="vector",
+            param=search_params,
+            limit=TOP_K,
+            output_fields=["source_type", "source_id"]
+        )[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        if any((hit.entity.get("source_type"), hit.entity.get("source_id")) == target for hit in hits):
+            hits_found += 1
+    return float(np.percentile(latencies, 95)), hits_found / len(gold)
+
+def write_env(env_file: str, key: str, value: int):
+    """更新.env中的配置项（不存在则追加）"""
+    lines = []
+    if os.path.exists(env_file):
+        with open(env_file, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+
+    entry = f"{key}={value}"
+    for i, line in enumerate(lines):
+        if line.split("=", 1)[0].strip() == key:
+            lines[i] = entry
+            break
+    else:
+        lines.append(entry)
+
+    with open(env_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Milvus检索参数调优")
+    parser.add_argument("--eval-file", required=True, help="评测集JSONL文件")
+    parser.add_argument("--sample", type=int, default=1000, help="评测样本数")
+    parser.add_argument("--trials", type=int, default=50, help="Optuna试验次数")
+    parser.add_argument("--recall-target", type=float, default=0.95, help="recall@5目标值")
+    parser.add_argument("--env-file", default=".env", help="写入最优参数的.env文件")
+    args = parser.parse_args()
+
+    pairs = load_eval_set(args.eval_file, args.sample)
+    gold = [(p["source_type"], p["source_id"]) for p in pairs]
+    print(f"评测样本数: {len(pairs)}")
+
+    # 查询向量只计算一次，各次试验复用
+    vectors = QwenEmbeddings(settings.QWEN_EMBEDDING_MODEL).embed_documents(
+        [p["question"] for p in pairs]
+    )
+
+    connections.connect(alias="default", host=settings.MILVUS_HOST, port=settings.MILVUS_PORT)
+    collection = Collection(settings.MILVUS_COLLECTION_NAME)
+    collection.load()
+
+    # 按集合上实际建立的索引确定搜索参数及范围（nprobe不能超过索引的nlist）
+    index_params = collection.indexes[0].params
+    if index_params["index_type"] == "HNSW":
+        param_name, env_key, low, high = "ef", "MILVUS_EF_SEARCH", TOP_K * 4, 512
+    else:
+        nlist = int(index_params["params"]["nlist"])
+        param_name, env_key, low, high = "nprobe", "MILVUS_NPROBE", 1, min(256, nlist)
+    print(f"索引类型: {index_params['index_type']}，搜索 {param_name} ∈ [{low}, {high}]")
+
+    def objective(trial: optuna.Trial) -> float:
+        value = trial.suggest_int(param_name, low, high, log=True)
+        p95, recall = evaluate(
+            collection, vectors, gold,
+            {"metric_type": "COSINE", "params": {param_name: value}}
+        )
+        trial.set_user_attr("p95_ms", p95)
+        trial.set_user_attr("recall", recall)
+        return p95 + RECALL_PENALTY * max(0.0, args.recall_target - recall)
+
+    study = optuna.create_study(direction="minimize")
+    study.optimize(objective, n_trials=args.trials)
+
+    best = study.best_trial
+    value = best.params[param_name]
+    print(
+        f"最优 {param_name}={value}，p95={best.user_attrs['p95_ms']:.2f}ms，"
+        f"recall@{TOP_K}={best.user_attrs['recall']:.3f}"
+    )
+    if best.user_attrs["recall"] < args.recall_target:
+        print(f"警告：未达到recall@{TOP_K}≥{args.recall_target}，请扩大搜索范围或重建索引")
+
+    write_env(args.env_file, env_key, value)
+    print(f"已写入 {args.env_file}: {env_key}={value}")
+
+if __name__ == "__main__":
+    main()